@@ -0,0 +1,232 @@
+from concurrent.futures import ProcessPoolExecutor
+import os
+import warnings
+
+import pandas as pd
+import numpy as np
+
+SELECTOR_COLUMNS = [
+    'loan_amnt', 'int_rate', 'grade', 'potential_return', 'actual_return',
+    'proba_bad_loan'
+    ]
+
+_worker_columns = None
+_worker_selectors = None
+
+
+def draw_samples(n_rows, sample_size, n_replicates, seed=None):
+    """(n_replicates, sample_size) row indices, each row sampled without replacement."""
+    rng = np.random.default_rng(seed)
+    return np.stack([
+        rng.choice(n_rows, size=sample_size, replace=False)
+        for _ in range(n_replicates)
+        ])
+
+
+def _init_worker(columns, selectors):
+    global _worker_columns, _worker_selectors
+    _worker_columns = columns
+    _worker_selectors = selectors
+
+
+def _run_replicates(budget, samples):
+    results = np.zeros((len(_worker_selectors), len(samples), 2))
+    for j, sample in enumerate(samples):
+        sample_columns = {
+            name: values[sample] for name, values in _worker_columns.items()}
+        for i, selector in enumerate(_worker_selectors):
+            results[i, j] = selector(budget, sample_columns, return_total_funding=True)
+    return results
+
+
+def backtest(df, selectors, budget=100000, sample_size=300, n_replicates=300,
+             seed=None, n_jobs=None):
+    """
+    Monte-Carlo comparison of loan selectors on random samples of `df`.
+
+    All sample index sets are drawn up front from `seed`, every selector sees
+    the same samples, and the replicates are spread over a process pool. The
+    columns are sent to each worker once as NumPy arrays.
+
+    Parameters
+    ----------
+    df: DataFrame with the SELECTOR_COLUMNS
+    selectors: list of selectors, e.g. `SelectorA` or
+        `functools.partial(SelectorD, treshold=0.11)`
+    budget: Scalar budget of each selection
+    sample_size: number of loans available in each replicate
+    n_replicates: number of samples
+    seed: seed of the sample draws
+    n_jobs: number of worker processes, `os.cpu_count()` if None, 1 runs
+        in-process
+
+    Returns
+    -------
+    results: array with shape (n_selectors, n_replicates, 2) of
+        (net return, total funding)
+    """
+    columns = {name: df[name].to_numpy() for name in SELECTOR_COLUMNS}
+    samples = draw_samples(len(df), sample_size, n_replicates, seed)
+    n_jobs = n_jobs or os.cpu_count()
+    if n_jobs == 1:
+        _init_worker(columns, selectors)
+        return _run_replicates(budget, samples)
+    chunks = np.array_split(samples, min(n_jobs * 4, n_replicates))
+    with ProcessPoolExecutor(
+            max_workers=n_jobs, initializer=_init_worker,
+            initargs=(columns, selectors)) as executor:
+        results = list(executor.map(_run_replicates, [budget] * len(chunks), chunks))
+    return np.concatenate(results, axis=1)
+
+
+def summarize_backtest(results, selector_names):
+    """Mean and std of the return, total investment and roi of every selector."""
+    net_return, total_investment = results[..., 0], results[..., 1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        roi = net_return / total_investment
+    roi[np.isinf(roi)] = 0
+    summary = {}
+    for name, values in [
+            ('actual_return', net_return), ('total_investment', total_investment),
+            ('roi', roi)]:
+        summary[(name, 'mean')] = np.nanmean(values, axis=1)
+        summary[(name, 'std')] = np.nanstd(values, axis=1, ddof=1)
+    return pd.DataFrame(summary, index=pd.Index(selector_names, name='selector'))
+
+
+def _sweep_metrics(cumsums, idx):
+    # `cumsums` maps quantity -> cumulative sums over the loans sorted by
+    # probability (last axis, with a leading 0), loans before `idx` are the
+    # ones SelectorD keeps (probability below the threshold)
+    def below(name):
+        return np.take(cumsums[name], idx, axis=-1)
+
+    def total(name):
+        return cumsums[name][..., -1:]
+
+    bad, good = below('bad'), below('good')
+    tp, fp = total('bad') - bad, total('good') - good
+    with np.errstate(divide='ignore', invalid='ignore'):
+        metrics = {
+            'tp': tp, 'fp': fp, 'tn': good, 'fn': bad,
+            'tpr': tp / total('bad'), 'fpr': fp / total('good'),
+            'precision': tp / (tp + fp),
+            'funding': below('loan_amnt'), 'actual_return': below('actual_return'),
+            }
+        metrics['roi'] = metrics['actual_return'] / metrics['funding']
+    if 'count' in cumsums:
+        metrics = {'n_selected': below('count'), **metrics}
+    return metrics
+
+
+def _cumsums(sorted_columns):
+    return {
+        name: np.concatenate([[0.], np.cumsum(values, dtype='float64')])
+        for name, values in sorted_columns.items()
+        }
+
+
+def _bootstrap_cumsums(sorted_columns, weights, idx):
+    # the weighted cumulative sums of every replicate (rows of `weights`)
+    # at `idx` and their totals: (n_replicates, len(idx) + 1) per quantity,
+    # read by `_sweep_metrics` at `arange(len(idx))`. One (n_replicates,
+    # n_loans) buffer is reused for every quantity.
+    buffer = np.empty(weights.shape)
+    positions = np.append(idx, weights.shape[1]) - 1
+    cumsums = {}
+    for name, values in sorted_columns.items():
+        np.multiply(weights, values, out=buffer)
+        np.cumsum(buffer, axis=-1, out=buffer)
+        cumsums[name] = np.where(positions >= 0, buffer[:, np.maximum(positions, 0)], 0.)
+    return cumsums
+
+
+_BANDED_METRICS = ['tpr', 'fpr', 'precision', 'funding', 'actual_return', 'roi']
+
+
+def threshold_sweep(df, y_true, thresholds=None, n_bootstrap=0, confidence=0.95,
+                    seed=None, chunksize=32, n_bins=200):
+    """
+    SelectorD's filter `proba_bad_loan < treshold` evaluated at every
+    threshold at once, funding every kept loan (no budget). The loans are
+    sorted by probability once and every metric is read from cumulative
+    sums, O(n log n) overall instead of one knapsack per sample and trial.
+
+    The positive class is 'Bad Loan' flagged at `proba_bad_loan >= threshold`,
+    as in the notebook's confusion matrix: `tpr` is the share of bad loans
+    rejected, `fpr` the share of good loans rejected and `precision` the
+    share of bad loans among the rejected ones. `funding` and
+    `actual_return` are the totals of the kept loans.
+
+    With `n_bootstrap`, the loans are resampled with replacement (multinomial
+    row weights, `chunksize` replicates at a time) and the `confidence`
+    band of `tpr`, `fpr`, `precision`, `funding`, `actual_return` and `roi`
+    is added as `{metric}_low` and `{metric}_high`. Every replicate of these
+    6 metrics is kept until the bands are taken, n_bootstrap * len(thresholds)
+    * 48 bytes, so the default thresholds are then `n_bins` quantiles of the
+    probabilities instead of every distinct one.
+
+    Parameters
+    ----------
+    df: DataFrame or dict of arrays with `proba_bad_loan`, `loan_amnt` and
+        `actual_return`
+    y_true: ArrayLike, 1 (or True) for bad loans
+    thresholds: ArrayLike of thresholds, every distinct probability (or with
+        `n_bootstrap` the `n_bins` quantiles) and inf (every loan kept) if None
+    n_bootstrap: number of bootstrap replicates, 0 skips the bands
+    confidence: coverage of the bootstrap bands
+    seed: seed of the bootstrap
+    chunksize: number of replicates drawn at once, each holds two
+        (chunksize, n_loans) arrays
+    n_bins: number of default thresholds with `n_bootstrap`
+
+    Returns
+    -------
+    sweep: DataFrame indexed by threshold, e.g. `sweep.actual_return.idxmax()`
+        is the threshold with the highest realized return
+    """
+    proba = np.asarray(df['proba_bad_loan'], dtype='float64')
+    order = np.argsort(proba, kind='stable')
+    sorted_proba = proba[order]
+    bad = np.asarray(y_true, dtype='float64')[order]
+    sorted_columns = {
+        'count': np.ones(len(proba)), 'bad': bad, 'good': 1 - bad,
+        'loan_amnt': np.asarray(df['loan_amnt'], dtype='float64')[order],
+        'actual_return': np.asarray(df['actual_return'], dtype='float64')[order],
+        }
+    if thresholds is None:
+        if n_bootstrap:
+            thresholds = np.unique(np.quantile(
+                sorted_proba, np.linspace(0, 1, n_bins), method='lower'))
+        else:
+            thresholds = np.unique(sorted_proba)
+        thresholds = np.append(thresholds, np.inf)
+    thresholds = np.asarray(thresholds, dtype='float64')
+    idx = np.searchsorted(sorted_proba, thresholds, side='left')
+    metrics = _sweep_metrics(_cumsums(sorted_columns), idx)
+    sweep = pd.DataFrame(
+        {name: values.ravel() for name, values in metrics.items()},
+        index=pd.Index(thresholds, name='threshold'))
+    if n_bootstrap:
+        rng = np.random.default_rng(seed)
+        replicates = {name: [] for name in _BANDED_METRICS}
+        bootstrap_columns = {
+            name: sorted_columns[name] for name in ['bad', 'good', 'loan_amnt', 'actual_return']}
+        pvals = np.full(len(proba), 1 / len(proba))
+        for start in range(0, n_bootstrap, chunksize):
+            size = min(chunksize, n_bootstrap - start)
+            # loans are exchangeable, the weights are drawn in sorted order
+            weights = rng.multinomial(len(proba), pvals, size=size)
+            chunk = _sweep_metrics(
+                _bootstrap_cumsums(bootstrap_columns, weights, idx), np.arange(len(idx)))
+            for name in _BANDED_METRICS:
+                replicates[name].append(chunk[name])
+        alpha = (1 - confidence) / 2
+        for name in _BANDED_METRICS:
+            values = np.concatenate(replicates[name])
+            with warnings.catch_warnings():
+                # thresholds keeping no loan have no roi in any replicate
+                warnings.simplefilter('ignore', RuntimeWarning)
+                sweep[f'{name}_low'], sweep[f'{name}_high'] = np.nanquantile(
+                    values, [alpha, 1 - alpha], axis=0)
+    return sweep
@@ -0,0 +1,367 @@
+"""
+Benchmark suite of the loan pipeline on synthetic data.
+
+    python -m modules.benchmark --rows 10000 100000 1000000
+
+The 10M rows size (`DEFAULT_ROWS`) holds the raw frame and its copies in
+memory, about 25 GB.
+
+Every stage is timed and its peak memory recorded, one JSON line per
+(stage, rows) is appended to `benchmarks/results.jsonl` together with the
+commit, so runs of two commits can be compared with `compare_benchmarks`.
+The `cold_start.*` stages start fresh interpreters and time them to their
+first prediction, loading the pickled pipelines or the LoanScorer artifact
+(see `modules.scoring_runtime`). The `read_loan_csv*` stages read the
+synthetic loans back from a csv file, with and without the row filters of
+LoanDataLabelPredictor pushed down (see `modules.data_ingest`), against a
+plain `pd.read_csv` of the same columns (`read_csv.usecols`).
+"""
+from datetime import datetime, timezone
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from sklearn.compose import ColumnTransformer
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, PowerTransformer
+from xgboost import XGBClassifier
+import xgboost as xgb
+import joblib
+import pandas as pd
+import numpy as np
+
+from modules.data_ingest import pipeline_pushdown, read_loan_csv
+from modules.data_preprocess import (
+    LoanDataPreprocess, LoanDataLabelPredictor, LoanDataMissingHandler
+    )
+from modules.feature_extract import LoanFeatureExtract
+from modules.instrumentation import _PeakRss, _reset_peak_rss
+from modules.loan_selection import SelectorA, SelectorB, SelectorC, SelectorD
+from modules.parallel_preprocess import PartitionedTransform
+from modules.scoring import LoanScorer
+from modules.synthetic_data import make_loans
+
+DEFAULT_ROWS = [10000, 100000, 1000000, 10000000]
+CATEGORICAL_COLS = [
+    'emp_length', 'home_ownership',
+    'verification_status', 'grade', 'sub_grade'
+    ]
+TRANSFORM_COLS = [
+    'annual_inc', 'dti', 'delinq_2yrs',
+    'open_acc',
+    'revol_bal', 'revol_util', 'total_acc',
+    'tot_coll_amt', 'tot_cur_bal',
+    'total_rev_hi_lim', 'pub_rec', 'int_rate',
+    'installment', 'loan_amnt'
+    ]
+
+
+def make_preprocess_pipeline():
+    """Preprocessing pipeline of the model notebook."""
+    return Pipeline([
+        ('preprocess', LoanDataPreprocess()),
+        ('extract_label_predictor', LoanDataLabelPredictor(
+            exclude=['earliest_cr_line', 'pymnt_plan', 'policy_code', 'term'],
+            include=['total_rec_prncp'])),
+        ('missing_handler', LoanDataMissingHandler()),
+        ])
+
+
+def make_selection_pipeline():
+    """
+    Preprocessing pipeline of the notebook's loan selection test set, which
+    keeps `total_pymnt` for the actual return of the selected loans.
+    """
+    return Pipeline([
+        ('preprocess', LoanDataPreprocess()),
+        ('extract_label_predictor', LoanDataLabelPredictor(
+            exclude=['earliest_cr_line', 'pymnt_plan', 'policy_code', 'term'],
+            include=['total_rec_prncp', 'total_pymnt'])),
+        ('missing_handler', LoanDataMissingHandler()),
+        ])
+
+
+def make_feature_pipeline():
+    """Feature pipeline of the model notebook."""
+    feature_modifier = ColumnTransformer([
+        ('categorical', OneHotEncoder(handle_unknown='ignore', sparse_output=False), CATEGORICAL_COLS),
+        ('power', PowerTransformer(standardize=False), TRANSFORM_COLS),
+        ], remainder='passthrough').set_output(transform='pandas')
+    return Pipeline([
+        ('feature_extract', LoanFeatureExtract()),
+        ('feature_modifier', feature_modifier)
+        ])
+
+
+def git_commit():
+    """Commit of the repository and whether it has local changes."""
+    repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=repo_dir).stdout.strip()
+        dirty = bool(subprocess.run(
+            ['git', 'status', '--porcelain', '--untracked-files=no'],
+            capture_output=True, text=True, check=True, cwd=repo_dir).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+
+class BenchmarkRun():
+    """
+    Collects the measurements of one run.
+
+    Parameters
+    ----------
+    memory: how the peak memory of every stage is measured, 'rss' (peak
+        resident set size above the one before the stage, Linux only, free),
+        'tracemalloc' (peak traced allocations, portable but slows the
+        stages down) or None
+    """
+    def __init__(self, memory='rss'):
+        if (memory == 'rss') and not _reset_peak_rss():
+            memory = 'tracemalloc'
+        self.memory = memory
+        commit, dirty = git_commit()
+        self.context = {
+            'commit': commit, 'dirty': dirty,
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(), 'pandas': pd.__version__,
+            'numpy': np.__version__, 'xgboost': xgb.__version__,
+            'machine': platform.machine(), 'cpu_count': os.cpu_count(),
+            'memory': memory,
+            }
+        self.results = []
+
+    def measure(self, stage, rows, function, *args, **kwargs):
+        """Run `function` once as `stage` and return its result."""
+        if self.memory == 'rss':
+            peak_rss = _PeakRss()
+            peak_rss.start()
+        elif self.memory == 'tracemalloc':
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            result = function(*args, **kwargs)
+            seconds = time.perf_counter() - start
+        finally:
+            peak_bytes = None
+            if self.memory == 'rss':
+                peak_bytes = peak_rss.stop()
+            elif self.memory == 'tracemalloc':
+                peak_bytes = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+        self.results.append({
+            **self.context, 'stage': stage, 'rows': rows, 'seconds': seconds,
+            'peak_bytes': peak_bytes,
+            })
+        return result
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'a') as f:
+            for result in self.results:
+                f.write(json.dumps(result) + '\n')
+        return path
+
+
+# time to first prediction of a fresh scoring worker, from the pickled
+# pipelines and classifier or from the saved LoanScorer artifact
+_COLD_START_LOAD = {
+    'joblib': (
+        'import joblib\n'
+        'from modules.scoring import LoanScorer\n'
+        'scorer = LoanScorer(*joblib.load(sys.argv[1]))\n'),
+    'artifact': (
+        'from modules.scoring_runtime import load_scorer\n'
+        'scorer = load_scorer(sys.argv[1])\n'),
+    }
+_COLD_START_SCRIPT = """import json, sys, time
+start = time.perf_counter()
+{load}proba = scorer.predict_proba(json.loads(sys.argv[2]))
+seconds = time.perf_counter() - start
+heavy = ['pandas', 'sklearn', 'xgboost', 'optuna', 'pyomo']
+imported = [name for name in heavy if name in sys.modules]
+with open('/proc/self/status') as f:
+    peak_bytes = next(int(line.split()[1]) * 1024 for line in f if line.startswith('VmHWM:'))
+print(json.dumps({{
+    'seconds': seconds, 'proba': proba, 'peak_bytes': peak_bytes, 'imported': imported}}))
+"""
+
+
+def cold_start(kind, path, record, repeat=5):
+    """
+    Start `repeat` fresh interpreters each scoring `record` with the scorer
+    loaded from `path` (`kind` 'joblib' or 'artifact'). Returns one dict per
+    start: `seconds` to the first prediction including the interpreter
+    start, `load_seconds` without it, the peak RSS and the heavy libraries
+    that got imported.
+    """
+    repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    script = _COLD_START_SCRIPT.format(load=_COLD_START_LOAD[kind])
+    results = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, '-c', script, path, json.dumps(record)],
+            capture_output=True, text=True, check=True, cwd=repo_dir).stdout
+        seconds = time.perf_counter() - start
+        result = json.loads(output)
+        result['load_seconds'] = result.pop('seconds')
+        results.append({'seconds': seconds, **result})
+    return results
+
+
+def _scorable_record(scorer, raw):
+    # first raw row, as csv fields, the scorer does not reject
+    for record in json.loads(raw.head(1000).to_json(orient='records')):
+        try:
+            scorer.predict_proba(record)
+            return record
+        except ValueError:
+            continue
+    raise ValueError('no scorable record in the first 1000 rows')
+
+
+def _measure_cold_start(run, n_rows, raw, preprocess_pipeline, feature_pipeline,
+                        classifier, repeat=5):
+    scorer = LoanScorer(preprocess_pipeline, feature_pipeline, classifier)
+    record = _scorable_record(scorer, raw)
+    with tempfile.TemporaryDirectory() as directory:
+        paths = {
+            'joblib': os.path.join(directory, 'scorer.joblib'),
+            'artifact': os.path.join(directory, 'scorer'),
+            }
+        joblib.dump((preprocess_pipeline, feature_pipeline, classifier), paths['joblib'])
+        scorer.save(paths['artifact'])
+        for kind, path in paths.items():
+            for result in cold_start(kind, path, record, repeat):
+                run.results.append({
+                    **run.context, 'stage': f'cold_start.{kind}', 'rows': n_rows,
+                    'seconds': result['seconds'], 'peak_bytes': result['peak_bytes'],
+                    'load_seconds': result['load_seconds'], 'imported': result['imported'],
+                    })
+
+
+def _measure_ingest(run, n_rows, raw, preprocess_pipeline):
+    pushdown = pipeline_pushdown(preprocess_pipeline)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'loans.csv')
+        raw.to_csv(path, index=False)
+        usecols = set(pushdown['usecols'])
+        run.measure(
+            'read_csv.usecols', n_rows, pd.read_csv, path,
+            usecols=lambda column: column in usecols)
+        run.measure(
+            'read_loan_csv', n_rows, read_loan_csv, path,
+            preprocess=pushdown['preprocess'], usecols=pushdown['usecols'])
+        run.measure('read_loan_csv.pushdown', n_rows, read_loan_csv, path, **pushdown)
+
+
+def _select_all(selection_df, budget, sample_size, n_samples, seed):
+    rng = np.random.default_rng(seed)
+    columns = {name: selection_df[name].to_numpy() for name in selection_df.columns}
+    for _ in range(n_samples):
+        sample = rng.choice(len(selection_df), size=min(sample_size, len(selection_df)), replace=False)
+        sample_columns = {name: values[sample] for name, values in columns.items()}
+        for selector in [SelectorA, SelectorB, SelectorC, SelectorD]:
+            selector(budget, sample_columns)
+
+
+def run_benchmark(n_rows, run: BenchmarkRun, seed=0, n_estimators=100):
+    """Time every stage of the pipeline on `n_rows` synthetic loans."""
+    raw = run.measure('make_loans', n_rows, make_loans, n_rows, seed)
+    # transformers one by one
+    preprocess = LoanDataPreprocess().fit()
+    X = run.measure('LoanDataPreprocess.transform', n_rows, preprocess.transform, raw.copy())
+    label_predictor = LoanDataLabelPredictor(
+        exclude=['earliest_cr_line', 'pymnt_plan', 'policy_code', 'term'],
+        include=['total_rec_prncp']).fit()
+    X = run.measure('LoanDataLabelPredictor.transform', n_rows, label_predictor.transform, X)
+    missing_handler = LoanDataMissingHandler()
+    run.measure('LoanDataMissingHandler.fit', n_rows, missing_handler.fit, X)
+    run.measure('LoanDataMissingHandler.transform', n_rows, missing_handler.transform, X)
+    # full pipelines
+    preprocess_pipeline = make_preprocess_pipeline()
+    X, y = run.measure(
+        'preprocess_pipeline.fit_transform', n_rows, preprocess_pipeline.fit_transform, raw.copy())
+    run.measure(
+        'PartitionedTransform.transform', n_rows,
+        PartitionedTransform(preprocess_pipeline).transform, raw)
+    _measure_ingest(run, n_rows, raw, preprocess_pipeline)
+    feature_pipeline = make_feature_pipeline()
+    X_transformed = run.measure(
+        'feature_pipeline.fit_transform', n_rows, feature_pipeline.fit_transform, X, y)
+    run.measure('feature_pipeline.transform', n_rows, feature_pipeline.transform, X)
+    # model
+    y_binary = (y == 'Bad Loan').astype(int)
+    classifier = XGBClassifier(
+        max_depth=4, alpha=10, learning_rate=0.5, n_estimators=n_estimators)
+    run.measure('XGBClassifier.fit', n_rows, classifier.fit, X_transformed, y_binary)
+    _measure_cold_start(run, n_rows, raw, preprocess_pipeline, feature_pipeline, classifier)
+    proba_bad_loan = run.measure(
+        'XGBClassifier.predict_proba', n_rows, classifier.predict_proba, X_transformed)[:, 1]
+    # loan selection on samples of the scored loans
+    X_selection, _ = make_selection_pipeline().fit_transform(raw.copy())
+    assert len(X_selection) == len(X)
+    selection_df = pd.DataFrame({
+        'loan_amnt': X_selection.loan_amnt, 'int_rate': X_selection.int_rate,
+        'grade': X_selection.grade,
+        'potential_return': X_selection.loan_amnt * X_selection.int_rate / 100,
+        'actual_return': X_selection.total_pymnt - X_selection.loan_amnt,
+        'proba_bad_loan': proba_bad_loan,
+        })
+    run.measure(
+        'loan_selection', n_rows, _select_all, selection_df, budget=100000,
+        sample_size=300, n_samples=20, seed=seed)
+    return run
+
+
+def load_benchmarks(path='benchmarks/results.jsonl'):
+    return pd.read_json(path, lines=True)
+
+
+def compare_benchmarks(results, base_commit, head_commit):
+    """
+    Seconds and peak memory of every (stage, rows) at `head_commit` relative
+    to `base_commit` (commit prefixes), the best of the repeated runs is
+    taken. A ratio above 1 is a regression.
+    """
+    def best(commit):
+        runs = results[results.commit.astype(str).str.startswith(commit)]
+        return runs.groupby(['stage', 'rows'])[['seconds', 'peak_bytes']].min()
+    base, head = best(base_commit), best(head_commit)
+    comparison = pd.concat({'base': base, 'head': head}, axis=1).dropna(how='all')
+    comparison[('ratio', 'seconds')] = comparison[('head', 'seconds')] / comparison[('base', 'seconds')]
+    comparison[('ratio', 'peak_bytes')] = \
+        comparison[('head', 'peak_bytes')] / comparison[('base', 'peak_bytes')]
+    return comparison
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the loan pipeline on synthetic data.')
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS[:3])
+    parser.add_argument('--output', default='benchmarks/results.jsonl')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--memory', default='rss', choices=['rss', 'tracemalloc', 'none'])
+    args = parser.parse_args(argv)
+    run = BenchmarkRun(memory=(None if args.memory == 'none' else args.memory))
+    for n_rows in args.rows:
+        run_benchmark(n_rows, run, seed=args.seed)
+        for result in run.results:
+            if result['rows'] == n_rows:
+                print(
+                    f'{n_rows:>10} {result["stage"]:<40} {result["seconds"]:>9.3f}s'
+                    f' {(result["peak_bytes"] or 0) / 2**20:>9.1f}MiB')
+    run.save(args.output)
+
+
+if __name__ == '__main__':
+    main()
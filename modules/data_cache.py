@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+
+from sklearn.pipeline import Pipeline
+import pandas as pd
+import pyarrow as pa
+import joblib
+
+from modules.data_preprocess import MISSING_RULES_VERSION
+
+
+def file_digest(filepath, block_size=2**20):
+    """Content hash of a file, read in blocks of `block_size` bytes."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class LoanDataCache():
+    """
+    On-disk cache of the `(predictor, label)` output of the preprocessing
+    pipeline, stored as uncompressed Arrow IPC files so later runs memory-map
+    the columns instead of parsing and transforming the csv again.
+
+    Entries are keyed by the source file content, the parameters of every
+    pipeline step and MISSING_RULES_VERSION. The least recently used entries
+    are evicted once the cache grows beyond `max_bytes`.
+
+    Parameters
+    ----------
+    cache_dir: directory of the cache files, created if missing
+    max_bytes: total size of the cached files
+    """
+    def __init__(self, cache_dir, max_bytes=20 * 2**30):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, filepath, pipeline: Pipeline, **read_csv_kws):
+        params = {
+            name: [step.__class__.__name__, step.get_params(deep=False)]
+            for name, step in pipeline.steps
+            }
+        description = json.dumps(
+            [file_digest(filepath), params, read_csv_kws, MISSING_RULES_VERSION],
+            sort_keys=True, default=str)
+        return hashlib.blake2b(description.encode(), digest_size=16).hexdigest()
+
+    def _path(self, key, extension):
+        return os.path.join(self.cache_dir, f'{key}.{extension}')
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(key, 'arrow')) \
+            and os.path.exists(self._path(key, 'joblib'))
+
+    def load_table(self, key):
+        """Memory-mapped `pa.Table` of a cached entry, labels in `loan_category`."""
+        path = self._path(key, 'arrow')
+        os.utime(path)
+        with pa.memory_map(path, 'r') as source:
+            return pa.ipc.open_file(source).read_all()
+
+    def load(self, key):
+        """
+        `(predictor, label)` of a cached entry. Numeric columns without
+        missing values stay on the memory map (zero copy, read-only: `.copy()`
+        the frame before writing to it in place), only the other columns
+        (missing values, categoricals, strings) are copied into memory.
+        """
+        table = self.load_table(key)
+        predictor = table.drop(['loan_category']).to_pandas(
+            split_blocks=True, self_destruct=True)
+        label = table.column('loan_category').to_numpy(zero_copy_only=False)
+        return predictor, label
+
+    def save(self, key, pipeline: Pipeline, predictor, label):
+        table = pa.Table.from_pandas(
+            predictor.assign(loan_category=label), preserve_index=False)
+        path = self._path(key, 'arrow')
+        with pa.OSFile(f'{path}.tmp', 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(f'{path}.tmp', path)
+        joblib.dump(pipeline, self._path(key, 'joblib'))
+        self._evict(keep=key)
+
+    def _evict(self, keep=None):
+        entries = {}
+        for filename in os.listdir(self.cache_dir):
+            key, extension = os.path.splitext(filename)
+            if extension not in ('.arrow', '.joblib'):
+                continue
+            stat = os.stat(os.path.join(self.cache_dir, filename))
+            size, used = entries.get(key, (0, 0))
+            entries[key] = (size + stat.st_size, max(used, stat.st_mtime))
+        total_bytes = sum(size for size, _ in entries.values())
+        for key, (size, _) in sorted(entries.items(), key=lambda x: x[1][1]):
+            if total_bytes <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            for extension in ('arrow', 'joblib'):
+                if os.path.exists(self._path(key, extension)):
+                    os.remove(self._path(key, extension))
+            total_bytes -= size
+
+    def fit_transform(self, filepath, pipeline: Pipeline, **read_csv_kws):
+        """
+        Cached `pipeline.fit_transform(pd.read_csv(filepath, **read_csv_kws))`.
+        On a hit the fitted state of the cached pipeline is copied to
+        `pipeline`, so it can transform other data right away. A cached
+        predictor is partly read-only (see `load`).
+        """
+        key = self.key(filepath, pipeline, **read_csv_kws)
+        if key in self:
+            cached_pipeline = joblib.load(self._path(key, 'joblib'))
+            for (_, step), (_, cached_step) in zip(pipeline.steps, cached_pipeline.steps):
+                step.__dict__.update(cached_step.__dict__)
+            return self.load(key)
+        predictor, label = pipeline.fit_transform(pd.read_csv(filepath, **read_csv_kws))
+        self.save(key, pipeline, predictor, label)
+        return predictor, label
@@ -1,27 +1,242 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+
 import pandas as pd
 import numpy as np
 
-class DataExploration():
-    """"""
-    def __init__(self, dataframe):
-        self._dataframe = dataframe.copy()
 
-    def show_nans_or_zeroes(self, label: str, filter=[]):
-        if list(filter):
-            features = list(filter)
+class ColumnProfile():
+    """
+    Mergeable one-pass summary of one column: counts of values, NaNs and
+    zeroes, min/max/sum of numeric and datetime values, a uniform random
+    sample of `sample_size` values for approximate quantiles, the smallest
+    value hashes for the cardinality (exact below `max_hashes` distinct
+    values) and the value counts for the top categories (exact below
+    `max_counts` distinct values).
+    """
+    def __init__(self, dtype, sample_size=10000, max_counts=1000, max_hashes=4096):
+        self.dtype = dtype
+        self.sample_size = sample_size
+        self.max_counts = max_counts
+        self.max_hashes = max_hashes
+        self.rows = 0
+        self.nans = 0
+        self.zeroes = 0
+        self.min = np.nan
+        self.max = np.nan
+        self.sum = 0.
+        self.sample = np.array([], dtype='float64')
+        self.hashes = np.array([], dtype='uint64')
+        self.counts = pd.Series(dtype='int64')
+
+    @property
+    def is_numeric(self):
+        return self.dtype.kind in 'iuf'
+
+    @classmethod
+    def from_values(cls, values: pd.Series, rng=None, **kwargs):
+        profile = cls(values.dtype, **kwargs)
+        rng = np.random.default_rng(rng)
+        profile.rows = len(values)
+        # value counts skip NaN, so the object columns are scanned only once
+        counts = values.value_counts(sort=False)
+        profile.nans = profile.rows - int(counts.sum())
+        if profile.is_numeric:
+            array = values.to_numpy()
+            if profile.nans:
+                array = array[~np.isnan(array)]
+            profile.zeroes = int(np.count_nonzero(array == 0))
+            if len(array):
+                profile.min, profile.max = array.min(), array.max()
+                profile.sum = float(array.sum(dtype='float64'))
+            if len(array) > profile.sample_size:
+                array = array[rng.choice(len(array), profile.sample_size, replace=False)]
+            profile.sample = array.astype('float64')
         else:
-            features = list(self._dataframe.columns)
+            try:
+                profile.zeroes = int(counts[np.asarray(counts.index == 0, dtype=bool)].sum())
+            except TypeError:
+                pass
+            if (profile.dtype.kind == 'M') and profile.rows > profile.nans:
+                profile.min, profile.max = values.min(), values.max()
+        hashes = np.sort(pd.util.hash_array(counts.index.to_numpy()))
+        profile.hashes = hashes[:profile.max_hashes]
+        profile.counts = _top_counts(counts, profile.max_counts)
+        return profile
+
+    def merge(self, other, rng=None):
+        """Profile of the rows of both profiles."""
+        rng = np.random.default_rng(rng)
+        if self.dtype != other.dtype:
+            if self.is_numeric and other.is_numeric:
+                self.dtype = np.result_type(self.dtype, other.dtype)
+            else:
+                self.dtype = np.dtype('O')
+        # both samples are uniform samples of their values, the merged one
+        # takes a hypergeometric share of each
+        if len(self.sample) + len(other.sample) > self.sample_size:
+            n_self = rng.hypergeometric(self.count, other.count, self.sample_size)
+            self.sample = np.concatenate([
+                rng.choice(self.sample, n_self, replace=False),
+                rng.choice(other.sample, self.sample_size - n_self, replace=False)
+                ])
+        else:
+            self.sample = np.concatenate([self.sample, other.sample])
+        self.rows += other.rows
+        self.nans += other.nans
+        self.zeroes += other.zeroes
+        self.min = np.nanmin([self.min, other.min]) if not _isnan(other.min) else self.min
+        self.max = np.nanmax([self.max, other.max]) if not _isnan(other.max) else self.max
+        self.sum += other.sum
+        self.hashes = np.union1d(self.hashes, other.hashes)[:self.max_hashes]
+        self.counts = _top_counts(
+            self.counts.add(other.counts, fill_value=0).astype('int64'), self.max_counts)
+        return self
+
+    @property
+    def count(self):
+        return self.rows - self.nans
+
+    @property
+    def mean(self):
+        return (self.sum / self.count) if (self.is_numeric and self.count) else np.nan
+
+    def quantile(self, q):
+        if len(self.sample) == 0:
+            return np.nan
+        return np.quantile(self.sample, q)
+
+    @property
+    def cardinality(self):
+        # k-minimum-values estimate once more than `max_hashes` distinct values
+        if len(self.hashes) < self.max_hashes:
+            return len(self.hashes)
+        return int((self.max_hashes - 1) / ((float(self.hashes[-1]) + 1) / 2 ** 64))
+
+    def top(self, k=5):
+        return self.counts.nlargest(k)
+
+
+def _isnan(value):
+    return isinstance(value, float) and value != value
+
+
+def _top_counts(counts, max_counts):
+    if len(counts) <= max_counts:
+        return counts
+    return counts.nlargest(max_counts)
+
+
+class DataProfile():
+    """
+    Mergeable column profiles of a frame, or of the chunks of a file too big
+    for memory. Each `update` profiles the columns of one frame in one pass
+    per column, spread over `n_jobs` threads, and merges them into
+    `profiles_`, columns are read as views without copying the frame.
+
+    Parameters
+    ----------
+    n_jobs: number of threads, `os.cpu_count()` if None
+    seed: seed of the quantile samples
+    profile_kws: ColumnProfile keyword arguments (`sample_size`,
+        `max_counts`, `max_hashes`)
+    """
+    def __init__(self, n_jobs=None, seed=0, **profile_kws):
+        self.n_jobs = n_jobs
+        self.seed = seed
+        self.profile_kws = profile_kws
+        self.profiles_ = {}
+        self._rng = np.random.default_rng(seed)
+
+    def update(self, frame: pd.DataFrame):
+        seeds = self._rng.integers(2 ** 32, size=frame.shape[1])
+        columns = [frame.iloc[:, i] for i in range(frame.shape[1])]
+        with ThreadPoolExecutor(max_workers=(self.n_jobs or os.cpu_count())) as executor:
+            profiles = list(executor.map(
+                lambda values, seed: ColumnProfile.from_values(values, seed, **self.profile_kws),
+                columns, seeds))
+        return self._merge_profiles(zip(frame.columns, profiles))
+
+    def _merge_profiles(self, profiles):
+        for feature, profile in profiles:
+            if feature in self.profiles_:
+                self.profiles_[feature].merge(profile, self._rng)
+            else:
+                self.profiles_[feature] = profile
+        return self
+
+    def merge(self, other):
+        """Profiles of the rows of both DataProfile, e.g. of two files."""
+        return self._merge_profiles(other.profiles_.items())
+
+    @classmethod
+    def from_csv(cls, filepath, chunksize=100000, n_jobs=None, seed=0,
+                 profile_kws={}, **read_csv_kws):
+        """Profile of a csv file read `chunksize` rows at a time."""
+        profile = cls(n_jobs, seed, **profile_kws)
+        for chunk in pd.read_csv(filepath, chunksize=chunksize, **read_csv_kws):
+            profile.update(chunk)
+        return profile
+
+    def _features(self, features=None):
+        if features is None or not list(features):
+            return list(self.profiles_)
+        return list(features)
+
+    def summary(self, features=None, quantiles=(0.25, 0.5, 0.75), top_k=5):
+        rows = {}
+        for feature in self._features(features):
+            profile = self.profiles_[feature]
+            row = {
+                'count': profile.count, 'nans': profile.nans, 'zeroes': profile.zeroes,
+                'min': profile.min, 'max': profile.max, 'mean': profile.mean,
+                }
+            for q in quantiles:
+                row[f'{q:.0%}'] = profile.quantile(q) if profile.is_numeric else np.nan
+            row['cardinality'] = profile.cardinality
+            row['top'] = profile.top(top_k).to_dict()
+            row['dtype'] = profile.dtype
+            rows[feature] = row
+        return pd.DataFrame.from_dict(rows, orient='index')
+
+    def show_nans_or_zeroes(self, label: str, filter=[]):
+        features = self._features(filter)
+        profiles = [self.profiles_[feature] for feature in features]
         if label == 'nans':
-            label_data = (self._dataframe[features].isna())
+            label_count = [profile.nans for profile in profiles]
         elif label == 'zeroes':
-            label_data = (self._dataframe[features] == 0)
+            label_count = [profile.zeroes for profile in profiles]
         else:
             raise ValueError('Wrong argument for "label"')
-        label_count = label_data.sum()
-        label_percent = label_data.mean() * 100
-        data_types = self._dataframe[features].dtypes
+        label_count = pd.Series(label_count, index=features, dtype='int64')
+        rows = pd.Series([profile.rows for profile in profiles], index=features)
         return(
-            pd.DataFrame({f'{label} Count'.title(): label_count, 
-                f'{label} Percentage (%)'.title(): label_percent,
-                'Data Types': data_types})
-            )
\ No newline at end of file
+            pd.DataFrame({f'{label} Count'.title(): label_count,
+                f'{label} Percentage (%)'.title(): label_count / rows * 100,
+                'Data Types': [profile.dtype for profile in profiles]})
+            )
+
+
+class DataExploration():
+    """
+    Exploration helpers over `dataframe`. The frame is not copied, its
+    columns are profiled once (see DataProfile) on the first query and every
+    later query is answered from the cached profiles, so the frame must not
+    be modified in between.
+    """
+    def __init__(self, dataframe, n_jobs=None):
+        self._dataframe = dataframe
+        self.n_jobs = n_jobs
+        self._profile = None
+
+    @property
+    def profile(self):
+        if self._profile is None:
+            self._profile = DataProfile(self.n_jobs).update(self._dataframe)
+        return self._profile
+
+    def show_nans_or_zeroes(self, label: str, filter=[]):
+        return self.profile.show_nans_or_zeroes(label, filter)
+
+    def summary(self, filter=[], **kwargs):
+        return self.profile.summary(filter, **kwargs)
@@ -0,0 +1,276 @@
+from sklearn.pipeline import Pipeline
+import pandas as pd
+import numpy as np
+
+from modules.data_preprocess import (
+    LoanDataPreprocess, LoanDataLabelPredictor, LoanDataMissingHandler, parse_month_year
+    )
+
+# rows parsed at once by a filtered `read_loan_csv` without `chunksize`
+_FILTER_CHUNKSIZE = 100000
+
+
+def loan_csv_dtypes(preprocess: LoanDataPreprocess):
+    """Parser dtype of every feature LoanDataPreprocess casts."""
+    # int features may hold NaN, they end up as float64 the same as
+    # LoanDataPreprocess' own casting (floats are cast last)
+    dtype = {feature: 'float64' for feature in preprocess.float_features_}
+    dtype.update({feature: 'str' for feature in preprocess.string_features_})
+    # parsed as categorical so every distinct month is converted only once
+    dtype.update({
+        feature: 'category' for feature in
+        preprocess.categorical_features_ + preprocess.datetime_features_
+        })
+    return dtype
+
+
+def _finish_parsing(X, preprocess):
+    for feature in preprocess.categorical_features_:
+        if (feature in X.columns) and (feature != 'emp_length') \
+                and isinstance(X[feature].dtype, pd.CategoricalDtype):
+            # the parser appends the categories of every block it reads,
+            # sorted as `astype('category')` sorts them
+            categories = X[feature].cat.categories
+            if not categories.is_monotonic_increasing:
+                X[feature] = X[feature].cat.reorder_categories(categories.sort_values())
+    for feature in preprocess.datetime_features_:
+        if feature in X.columns:
+            X[feature] = parse_month_year(X[feature])
+    if 'emp_length' in X.columns:
+        emp_length = X['emp_length']
+        categories = emp_length.cat.categories
+        emp_length = emp_length.cat.rename_categories({
+            value: replace_value
+            for value, replace_value in preprocess.emp_length_replace_.items()
+            if value in categories
+            })
+        X['emp_length'] = pd.Categorical(
+            values=emp_length,
+            categories=preprocess.emp_length_order_,
+            ordered=True
+            )
+    return X
+
+
+def _read_filtered(filepath, preprocess, dtype, usecols, row_filter, read_csv_kws):
+    # a single chunked pass: the kept rows of every chunk are finished, the
+    # dropped ones are released with their chunk
+    chunksize = read_csv_kws.pop('chunksize', None)
+    if usecols is not None:
+        read_csv_kws['usecols'] = lambda column: column in usecols
+    category_features = [
+        feature for feature, dtype_ in dtype.items()
+        if (dtype_ == 'category')
+        and (feature not in preprocess.datetime_features_) and (feature != 'emp_length')
+        ]
+    reader = pd.read_csv(
+        filepath, dtype=dtype, chunksize=chunksize or _FILTER_CHUNKSIZE, **read_csv_kws)
+
+    def kept_chunks(categories):
+        n_kept = 0
+        for chunk in reader:
+            for feature in category_features:
+                if feature in chunk.columns:
+                    categories.setdefault(feature, []).append(chunk[feature].cat.categories)
+            chunk = chunk[row_filter.keep_rows(chunk)]
+            chunk.index = pd.RangeIndex(n_kept, n_kept + len(chunk))
+            n_kept += len(chunk)
+            yield _finish_parsing(chunk, preprocess)
+
+    if chunksize:
+        # as for an unfiltered chunked read, every chunk has the categories
+        # of its own rows
+        return kept_chunks({})
+    categories = {}
+    chunks = list(kept_chunks(categories))
+    # the categories of every row, dropped ones included, as a full read
+    # would parse them
+    for feature, chunk_categories in categories.items():
+        categories_ = chunk_categories[0].append(chunk_categories[1:]).unique().sort_values()
+        for chunk in chunks:
+            chunk[feature] = chunk[feature].cat.set_categories(categories_)
+    return pd.concat(chunks)
+
+
+def read_loan_csv(filepath, preprocess=None, usecols=None, row_filter=None, **read_csv_kws):
+    """
+    Read a LendingClub csv with every feature parsed to the dtype
+    LoanDataPreprocess would cast it to, so its `transform` has nothing left
+    to cast but the string stripping.
+
+    With a `row_filter`, the file is read in one pass of chunks (of
+    `chunksize` rows if given) and only the rows it keeps are finished
+    (month-years parsed, categories fixed) and held: the dropped rows are
+    still tokenized and converted, a csv has no row index to skip them by,
+    but never outlive their chunk, so the peak memory is the one of the
+    kept rows. The categories are those of every row of the file (of every
+    chunk with `chunksize`), so the pipeline output is unchanged.
+
+    Parameters
+    ----------
+    filepath: csv file path or buffer
+    preprocess: fitted LoanDataPreprocess, a default one is used if None
+    usecols: features to read, e.g.
+        `LoanDataLabelPredictor.get_required_features()`. Other columns of
+        the file are never materialized.
+    row_filter: fitted LoanDataLabelPredictor (anything with
+        `get_filter_features()` and `keep_rows(X)`), only the rows its
+        `transform` keeps are read. See `pipeline_pushdown`.
+    read_csv_kws: extra keyword arguments passed to `pd.read_csv`. With
+        `chunksize`, an iterator of parsed chunks is returned.
+    """
+    if preprocess is None:
+        preprocess = LoanDataPreprocess().fit()
+    dtype = loan_csv_dtypes(preprocess)
+    if usecols is not None:
+        usecols = set(usecols)
+        if row_filter is not None:
+            usecols.update(row_filter.get_filter_features())
+        dtype = {
+            feature: dtype_ for feature, dtype_ in dtype.items()
+            if feature in usecols
+            }
+    dtype.update(read_csv_kws.pop('dtype', {}))
+    if row_filter is not None:
+        return _read_filtered(filepath, preprocess, dtype, usecols, row_filter, read_csv_kws)
+    if usecols is not None:
+        read_csv_kws['usecols'] = lambda column: column in usecols
+    X = pd.read_csv(filepath, dtype=dtype, **read_csv_kws)
+    if read_csv_kws.get('chunksize'):
+        return (_finish_parsing(chunk, preprocess) for chunk in X)
+    return _finish_parsing(X, preprocess)
+
+
+def pipeline_pushdown(pipeline: Pipeline):
+    """
+    `read_loan_csv` keyword arguments pushing the column needs and row
+    filters of a preprocessing pipeline into the reader:
+    `read_loan_csv(filepath, **pipeline_pushdown(pipeline))` only parses the
+    features and rows LoanDataLabelPredictor keeps, and
+    `pipeline.transform` of the result equals the one of the whole file.
+    The LoanDataPreprocess and LoanDataLabelPredictor steps are fitted (their
+    `fit` needs no data).
+    """
+    preprocess = next(
+        step for _, step in pipeline.steps if isinstance(step, LoanDataPreprocess))
+    label_predictor = next(
+        step for _, step in pipeline.steps if isinstance(step, LoanDataLabelPredictor))
+    label_predictor.fit()
+    return {
+        'preprocess': preprocess.fit(),
+        'usecols': label_predictor.get_required_features(),
+        'row_filter': label_predictor,
+        }
+
+
+class LoanDataStream():
+    """
+    Chunked execution of the LoanDataPreprocess -> LoanDataLabelPredictor ->
+    LoanDataMissingHandler pipeline over a csv file.
+
+    `fit` makes one streaming pass to collect everything the in-memory path
+    derives from the whole frame (parsed dtypes, category sets and
+    `median_cond_3_`), `transform` makes a second pass yielding
+    `(predictor, label)` per chunk. Concatenating the chunks gives the same
+    result as `pipeline.fit_transform(pd.read_csv(filepath))`.
+
+    Parameters
+    ----------
+    pipeline: Pipeline of the three transformers
+    chunksize: number of csv rows held in memory at once
+    read_csv_kws: extra keyword arguments passed to `pd.read_csv`
+    """
+    def __init__(self, pipeline: Pipeline, chunksize=100000, **read_csv_kws):
+        self.pipeline = pipeline
+        self.chunksize = chunksize
+        self.read_csv_kws = read_csv_kws
+
+    def _read_chunks(self, filepath, dtype=None):
+        read_csv_kws = dict(self.read_csv_kws)
+        if dtype:
+            read_csv_kws['dtype'] = {**dtype, **read_csv_kws.get('dtype', {})}
+        return pd.read_csv(filepath, chunksize=self.chunksize, **read_csv_kws)
+
+    def _fix_categories(self, X):
+        for feature, categories in self.categories_.items():
+            if (feature in X.columns) \
+                    and isinstance(X[feature].dtype, pd.CategoricalDtype):
+                X[feature] = X[feature].cat.set_categories(categories)
+        return X
+
+    def _transform_chunk(self, X, steps):
+        for _, step in steps:
+            X = step.transform(X)
+            if isinstance(step, LoanDataPreprocess):
+                X = self._fix_categories(X)
+        return X
+
+    def fit(self, filepath):
+        steps = self.pipeline.steps
+        for _, step in steps:
+            if not isinstance(step, LoanDataMissingHandler):
+                step.fit()
+        preprocess = next(
+            step for _, step in steps if isinstance(step, LoanDataPreprocess))
+        categorical_features = [
+            feature for feature in preprocess.categorical_features_
+            if feature != 'emp_length'
+            ]
+        dtype_kinds = {}
+        uniques = {feature: [] for feature in categorical_features}
+        for _, step in steps:
+            if isinstance(step, LoanDataMissingHandler):
+                step._reset_statistics()
+        for chunk in self._read_chunks(filepath):
+            for feature, dtype in chunk.dtypes.items():
+                dtype_kinds.setdefault(feature, set()).add(dtype.kind)
+            for feature in categorical_features:
+                if feature in chunk.columns:
+                    uniques[feature].append(chunk[feature].dropna().unique())
+            X = chunk
+            for _, step in steps:
+                if isinstance(step, LoanDataMissingHandler):
+                    step.partial_fit(X)
+                    break
+                X = step.transform(X)
+        # dtypes the parser infers when it sees the whole file at once
+        self.dtypes_ = {}
+        for feature, kinds in dtype_kinds.items():
+            if 'O' in kinds and len(kinds) > 1:
+                self.dtypes_[feature] = 'object'
+            elif kinds == {'i', 'f'}:
+                self.dtypes_[feature] = 'float64'
+        self.categories_ = {
+            feature: pd.Categorical(np.concatenate(values)).categories
+            for feature, values in uniques.items() if values
+            }
+        return self
+
+    def transform(self, filepath):
+        """Yield `(predictor, label)` for every chunk of `filepath`."""
+        for chunk in self._read_chunks(filepath, self.dtypes_):
+            yield self._transform_chunk(chunk, self.pipeline.steps)
+
+    def fit_transform(self, filepath):
+        return self.fit(filepath).transform(filepath)
+
+    def to_parquet(self, filepath, output_path):
+        """
+        Write the transformed chunks of `filepath` to `output_path` one row
+        group at a time, the labels are stored in `loan_category`.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        writer = None
+        try:
+            for predictor, label in self.transform(filepath):
+                table = pa.Table.from_pandas(
+                    predictor.assign(loan_category=label), preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(output_path, table.schema)
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+        return output_path
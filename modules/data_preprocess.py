@@ -2,9 +2,82 @@ from sklearn.base import BaseEstimator, TransformerMixin
 import pandas as pd
 import numpy as np
 
+from modules.instrumentation import stage
+from modules.missing_rules import (
+    _isna, MISSING_RULES_VERSION, MISSING_RULES, MANDATORY_FEATURES,
+    REPLACE_0_FEATURES, REPLACE_300_FEATURES
+    )
+
+def parse_month_year(values):
+    """
+    Same as `pd.to_datetime(values, format='%b-%Y')`, but every distinct
+    value is only parsed once. Categorical input is parsed by its categories.
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes, uniques = values.cat.codes.to_numpy(), values.cat.categories
+    else:
+        codes, uniques = pd.factorize(values)
+    if len(uniques) == 0:
+        return pd.Series(
+            pd.NaT, index=values.index, name=values.name, dtype='datetime64[ns]')
+    parsed = pd.to_datetime(uniques, format='%b-%Y')
+    return pd.Series(
+        parsed.take(codes, allow_fill=True, fill_value=pd.NaT), index=values.index,
+        name=values.name)
+
+def narrowest_dtype(values):
+    """
+    Narrowest dtype holding the numeric `values` without loss: int16 or
+    int32 for integral values without NaN, float32 when every value
+    round-trips through it, otherwise the dtype of `values`.
+    """
+    values = np.asarray(values)
+    if values.dtype.kind not in 'iuf':
+        return values.dtype
+    finite = values[np.isfinite(values)] if values.dtype.kind == 'f' else values
+    if (len(finite) == len(values)) and (len(values) > 0) \
+            and np.array_equal(finite, np.round(finite)):
+        for dtype in ['int16', 'int32']:
+            if (finite.min() >= np.iinfo(dtype).min) and (finite.max() <= np.iinfo(dtype).max):
+                return np.dtype(dtype)
+    if np.array_equal(values.astype('float32'), values, equal_nan=True):
+        return np.dtype('float32')
+    return values.dtype
+
+def compact_string_dtype(values, max_unique_ratio=0.5):
+    """
+    'category' for repeated strings, Arrow strings for mostly unique ones
+    (the dtype of `values` if pyarrow is not installed).
+    """
+    if values.nunique() <= max_unique_ratio * values.count():
+        return 'category'
+    try:
+        return pd.StringDtype('pyarrow')
+    except ImportError:
+        return values.dtype
+
+def compact_strings(values, max_unique_ratio=0.5):
+    """
+    Repeated strings as categorical, mostly unique ones as Arrow strings
+    (object strings are kept if pyarrow is not installed).
+    """
+    return values.astype(compact_string_dtype(values, max_unique_ratio))
+
 class LoanDataPreprocess(BaseEstimator, TransformerMixin):
-    def __init__(self):
-        pass
+    """
+    Parameters
+    ----------
+    compact: downcast the numeric features to the narrowest dtype holding
+        their observed values (see `narrowest_dtype`), cast the datetime and
+        categorical features and compact the string features (see `compact_strings`).
+        Under a PipelineInstrumentation, the memory of the frame before and
+        after `transform` is recorded as `frame_bytes_in` and `frame_bytes_out`
+        of its stage. Dtypes follow the values of each transformed frame, so
+        chunks of one file may get different dtypes, unless `compact_dtypes_`
+        is set to the `compact_dtypes` of the whole file.
+    """
+    def __init__(self, compact=False):
+        self.compact = compact
 
     def fit(self, X=None, y=None):
         self.float_features_ = [
@@ -42,34 +115,110 @@ class LoanDataPreprocess(BaseEstimator, TransformerMixin):
             'less 1 year', '1 year', '2 years', '3 years', '4 years', 
             '5 years', '6 years', '7 years', '8 years', '9 years', 'more 10 years'
             ]
+        self.emp_length_replace_ = {
+            '< 1 year': 'less 1 year', '10+ years': 'more 10 years'
+            }
         return self
+
+    def _features(self, X, features, dtype=None):
+        # features present in X, skipping those already parsed as `dtype`
+        return [
+            feature for feature in features
+            if (feature in X.columns)
+            and ((dtype is None) or (X[feature].dtype != dtype))
+            ]
+
+    def _is_emp_length_parsed(self, X):
+        dtype = X['emp_length'].dtype
+        return isinstance(dtype, pd.CategoricalDtype) and dtype.ordered \
+            and (list(dtype.categories) == self.emp_length_order_)
         
+    def compact_dtypes(self, X):
+        """
+        Dtypes `compact=True` casts the numeric float and the string features
+        of the raw frame X to, the same as `transform(X)` chooses.
+        """
+        return {
+            **{
+                feature: narrowest_dtype(X[feature])
+                for feature in self._features(X, self.float_features_)
+                if X[feature].dtype.kind in 'iuf'
+                },
+            **{
+                feature: compact_string_dtype(X[feature].str.strip())
+                for feature in self._features(X, self.string_features_)
+                },
+            }
+
+    def _compact(self, X):
+        dtypes = getattr(self, 'compact_dtypes_', {})
+        for feature in self._features(X, self.float_features_):
+            dtype = dtypes[feature] if feature in dtypes else narrowest_dtype(X[feature])
+            X[feature] = X[feature].astype(dtype)
+        for feature in self._features(X, self.string_features_):
+            if feature in dtypes:
+                X[feature] = X[feature].astype(dtypes[feature])
+            else:
+                X[feature] = compact_strings(X[feature])
+        for feature in self._features(X, self.datetime_features_, 'datetime64[ns]'):
+            X[feature] = X[feature].astype('datetime64[ns]')
+        for feature in self._features(X, self.categorical_features_, 'category'):
+            X[feature] = X[feature].astype('category')
+        return X
+
     def transform(self, X, y=None):
+        with stage('LoanDataPreprocess.transform', len(X)) as record:
+            if self.compact and record.enabled:
+                record.set(frame_bytes_in=X.memory_usage(deep=True).sum())
+            X = self._transform(X)
+            if self.compact and record.enabled:
+                record.set(frame_bytes_out=X.memory_usage(deep=True).sum())
+            return X
+
+    def _transform(self, X):
+        # columns already parsed to their final dtype (see
+        # `modules.data_ingest.read_loan_csv`) are left untouched
+        emp_length_parsed = self._is_emp_length_parsed(X)
         # replace ambiguous
-        X.loc[X.emp_length == '< 1 year', 'emp_length'] = 'less 1 year'
-        X.loc[X.emp_length == '10+ years', 'emp_length'] = 'more 10 years'
+        if not emp_length_parsed:
+            with stage('LoanDataPreprocess.emp_length_replace', len(X)):
+                for value, replace_value in self.emp_length_replace_.items():
+                    X.loc[X.emp_length == value, 'emp_length'] = replace_value
         # numerical datatype casting
-        for int_feature in self.int_features_ :
-            X.loc[:, int_feature] = X.loc[:, int_feature].astype('int64', errors='ignore')
-        for float_feature in self.float_features_:
-            X.loc[:, float_feature] = X.loc[:, float_feature].astype('float64', errors='ignore')
+        with stage('LoanDataPreprocess.int_cast', len(X)):
+            int_features = [
+                feature for feature in self._features(X, self.int_features_, 'int64')
+                if not ((feature in self.float_features_) and (X[feature].dtype == 'float64'))
+                ]
+            for int_feature in int_features:
+                X.loc[:, int_feature] = X.loc[:, int_feature].astype('int64', errors='ignore')
+        with stage('LoanDataPreprocess.float_cast', len(X)):
+            for float_feature in self._features(X, self.float_features_, 'float64'):
+                X.loc[:, float_feature] = X.loc[:, float_feature].astype('float64', errors='ignore')
         # strip string
-        for string_feature in self.string_features_:
-            X.loc[:, string_feature] = X.loc[:, string_feature].str.strip()
+        with stage('LoanDataPreprocess.string_strip', len(X)):
+            for string_feature in self._features(X, self.string_features_):
+                X.loc[:, string_feature] = X.loc[:, string_feature].str.strip()
         # datetime datatype casting
-        for datetime_feature in self.datetime_features_:
-            X.loc[:, datetime_feature] = \
-                pd.to_datetime(X.loc[:, datetime_feature], format='%b-%Y')
+        with stage('LoanDataPreprocess.datetime_parse', len(X)):
+            for datetime_feature in self._features(X, self.datetime_features_, 'datetime64[ns]'):
+                X.loc[:, datetime_feature] = parse_month_year(X.loc[:, datetime_feature])
         # categorical datatype casting
-        for categorical_feature in self.categorical_features_:
-            X.loc[:, categorical_feature] = \
-                X.loc[:, categorical_feature].astype('category', errors='ignore')
+        with stage('LoanDataPreprocess.categorical_cast', len(X)):
+            for categorical_feature in self._features(X, self.categorical_features_, 'category'):
+                X.loc[:, categorical_feature] = \
+                    X.loc[:, categorical_feature].astype('category', errors='ignore')
         # ordinal category order
-        X['emp_length'] = pd.Categorical(
-            values=X['emp_length'],
-            categories=self.emp_length_order_,
-            ordered=True
-            )
+        if not emp_length_parsed:
+            with stage('LoanDataPreprocess.emp_length_order', len(X)):
+                X['emp_length'] = pd.Categorical(
+                    values=X['emp_length'],
+                    categories=self.emp_length_order_,
+                    ordered=True
+                    )
+        if self.compact:
+            with stage('LoanDataPreprocess.compact', len(X)):
+                X = self._compact(X)
         return X
 
 class LoanDataLabelPredictor(BaseEstimator, TransformerMixin):
@@ -111,250 +260,218 @@ class LoanDataLabelPredictor(BaseEstimator, TransformerMixin):
             'Does not meet the credit policy. Status:Fully Paid': 'Good Loan'
             }
         return self
+
+    def _selected_features(self):
+        features = self.applicant_features_ + self.loan_features_ + self.include
+        # as `drop(columns=exclude)` of the selected features would
+        unknown = [feature for feature in self.exclude if feature not in features]
+        if unknown:
+            raise KeyError(f'{unknown} not found in axis')
+        return [feature for feature in features if feature not in self.exclude]
+
+    def get_required_features(self):
+        # raw features `transform` reads, the rest can be left out at ingest
+        return self.get_filter_features() + self._selected_features()
+
+    def get_filter_features(self):
+        # raw features the row filters of `transform` read
+        return ['application_type', 'loan_status']
+
+    def _is_individual(self, application_type):
+        return application_type.str.upper() == 'INDIVIDUAL'
+
+    def keep_rows(self, X):
+        """
+        Boolean mask of the rows of X `transform` keeps: 'INDIVIDUAL'
+        applications whose loan status maps to a Good or Bad Loan. Only the
+        `get_filter_features()` columns are read, raw or parsed, so the
+        filters can be pushed into ingest (see `modules.data_ingest.read_loan_csv`).
+        """
+        loan_category = X.loan_status.map(self.mapping_loan_cat_)
+        return (
+            self._is_individual(X.application_type)
+            & loan_category.isin(['Good Loan', 'Bad Loan'])
+            ).to_numpy(dtype=bool)
     
     def transform(self, X, y=None):
+        with stage('LoanDataLabelPredictor.transform', len(X)) as record:
+            X = self._transform(X)
+            record.set(rows_out=len(X[0]) if isinstance(X, tuple) else len(X))
+            return X
+
+    def _transform(self, X):
         # Filter to only have 'INDIVIDUAL'
-        X = X[X.application_type.str.upper() == 'INDIVIDUAL']
+        with stage('LoanDataLabelPredictor.application_type_filter', len(X)) as record:
+            X = X[self._is_individual(X.application_type)]
+            record.set(rows_out=len(X))
         # Create Label
-        X = X.assign(
-            loan_category=X.loan_status.map(self.mapping_loan_cat_)
-            )
+        with stage('LoanDataLabelPredictor.label', len(X)):
+            X = X.assign(
+                loan_category=X.loan_status.map(self.mapping_loan_cat_)
+                )
         # Filter to only have Good Loan and Bad Loan
-        X = X[X.loan_category.isin(['Good Loan', 'Bad Loan'])].reset_index()
+        with stage('LoanDataLabelPredictor.label_filter', len(X)) as record:
+            X = X[X.loan_category.isin(['Good Loan', 'Bad Loan'])].reset_index()
+            record.set(rows_out=len(X))
         # return only selected 
         if not self.exclude:
             return X[['loan_category']
                      + self.applicant_features_ 
                      + self.loan_features_ + self.include],
         else:
-            return X[['loan_category']
-                     + self.applicant_features_ 
-                     + self.loan_features_ + self.include].drop(columns=self.exclude)
+            # excluded features are not selected, they may be absent from X
+            return X[['loan_category'] + self._selected_features()]
+
+def _median_from_counts(counts):
+    """Median of the values described by a `value -> count` Series."""
+    counts = counts[counts > 0].sort_index()
+    if counts.empty:
+        return np.nan
+    values = counts.index.to_numpy(dtype='float64')
+    cum_counts = counts.to_numpy().cumsum()
+    n = cum_counts[-1]
+    lower = values[np.searchsorted(cum_counts, (n - 1) // 2, side='right')]
+    upper = values[np.searchsorted(cum_counts, n // 2, side='right')]
+    return (lower + upper) / 2
+
+class _ColumnArrays(dict):
+    """Lazy column -> ndarray mapping over a DataFrame, copied on first write."""
+    def __init__(self, frame):
+        super().__init__()
+        self._frame = frame
+        self.written_ = []
+
+    def __missing__(self, feature):
+        values = self._frame[feature].to_numpy()
+        self[feature] = values
+        return values
+
+    def writable(self, feature, value=None):
+        values = self[feature]
+        if feature not in self.written_:
+            values = values.copy()
+            self.written_.append(feature)
+        if (value is not None) and (values.dtype.kind in 'iu') \
+                and not float(value).is_integer():
+            values = values.astype('float64')
+        self[feature] = values
+        return values
 
 class LoanDataMissingHandler(BaseEstimator, TransformerMixin):
-    def __init__(self):
-        pass
+    """
+    Parameters
+    ----------
+    compact: downcast the filled features to the narrowest dtype holding
+        their values (e.g. int16 for the 300-sentinel `mths_since_*`)
+    """
+    median_decimals = 2
 
-    def _perform(self, masking, feature=None, replace_value=None, drop_obs=False):
-        if replace_value:
-            self.X.loc[masking, feature] = replace_value
-        if drop_obs:
-            self.X = self.X.drop(self.X[masking].index)
+    def __init__(self, compact=False):
+        self.compact = compact
 
-    def fit(self, X, y=None):
-        self.median_cond_3_ = X.loc[
+    @staticmethod
+    def _cond_3_values(X):
+        return X.loc[
             (X.delinq_2yrs > 0) & (X.acc_now_delinq == 0),
-            'mths_since_last_delinq'].median()
-        return self 
+            'mths_since_last_delinq']
+
+    def _reset_statistics(self):
+        self.cond_3_counts_ = pd.Series(dtype='int64')
+
+    def fit(self, X, y=None):
+        self._reset_statistics()
+        return self.partial_fit(X)
+
+    def partial_fit(self, X, y=None):
+        """
+        Fold the observations of X into the fitted statistics. The median is
+        kept as counts of the values rounded to `median_decimals`, so it is
+        exact for the whole-month values of the data (within half a unit of
+        the last decimal otherwise) and the memory is bounded by the number
+        of distinct rounded values.
+        """
+        if not hasattr(self, 'cond_3_counts_'):
+            self._reset_statistics()
+        values = self._cond_3_values(X).astype('float64').round(self.median_decimals)
+        self.cond_3_counts_ = self.cond_3_counts_.add(
+            values.value_counts(), fill_value=0).astype('int64')
+        self.median_cond_3_ = _median_from_counts(self.cond_3_counts_)
+        return self
+
+    def _replace_value(self, replace_value):
+        if isinstance(replace_value, str):
+            return getattr(self, replace_value)
+        return replace_value
 
     def transform(self, X, y=None):
-        self.X = X
-        # mths_since_last_record
-        rec_condition_1 = (self.X.mths_since_last_record.isna()) & (self.X.pub_rec == 0)
-        self._perform(rec_condition_1, 'mths_since_last_record', 300)
-        rec_condition_2 = (self.X.mths_since_last_record.isna()) & (self.X.pub_rec > 0)
-        self._perform(rec_condition_2, 'mths_since_last_record', 1)
-        rec_condition_3 = (self.X.mths_since_last_record.isna()) & (self.X.pub_rec.isna())
-        self._perform(rec_condition_3, drop_obs=True)
-        # mths_since_last_delinq
-        last_delinq_condition_1 = \
-            (self.X.mths_since_last_delinq.isna())\
-            & (self.X.delinq_2yrs == 0)\
-            & (self.X.acc_now_delinq == 0)
-        self._perform(last_delinq_condition_1, 'mths_since_last_delinq', 300)
-        last_delinq_condition_2 = \
-            (self.X.mths_since_last_delinq.isna())\
-            & (self.X.delinq_2yrs > 0)\
-            & (self.X.acc_now_delinq > 0)
-        self._perform(last_delinq_condition_2, 'mths_since_last_delinq', 1)
-        last_delinq_condition_3 = \
-            (self.X.mths_since_last_delinq.isna())\
-            & (self.X.delinq_2yrs > 0)\
-            & (self.X.acc_now_delinq == 0)
-        self._perform(last_delinq_condition_3, 'mths_since_last_delinq', self.median_cond_3_)
-        last_delinq_condition_4 = \
-            (self.X.mths_since_last_delinq == 0)\
-            & (self.X.delinq_2yrs > 0)\
-            & (self.X.acc_now_delinq == 0)
-        self._perform(last_delinq_condition_4, 'mths_since_last_delinq', self.median_cond_3_)
-        last_delinq_condition_5 = \
-            (self.X.mths_since_last_delinq.between(0, 25, inclusive='neither'))\
-            & (self.X.delinq_2yrs == 0)\
-            & (self.X.acc_now_delinq == 0)
-        self._perform(last_delinq_condition_5, 'delinq_2yrs', 1)
-        last_delinq_condition_6 = \
-            (self.X.mths_since_last_delinq == 0)\
-            & (self.X.delinq_2yrs == 0)\
-            & (self.X.acc_now_delinq == 0)
-        self._perform(last_delinq_condition_6, 'mths_since_last_delinq', 300)
-        last_delinq_condition_7 = \
-            (self.X.mths_since_last_delinq.isna())\
-            & (self.X.delinq_2yrs.isna())\
-            & (self.X.acc_now_delinq.isna())
-        self._perform(last_delinq_condition_7, drop_obs=True)
-        # inq_last_{6mths, 12mths}
-        inq_condition_1 = \
-            (self.X.inq_last_6mths.isna() | self.X.inq_last_12m.isna())\
-            & (self.X.inq_fi == 0)
-        self._perform(inq_condition_1, ['inq_last_6mths', 'inq_last_12m'], 0)
-        inq_condition_2 = \
-            (self.X.inq_last_6mths.isna() | self.X.inq_last_12m.isna())\
-            & (self.X.inq_fi > 0)
-        try:
-            self._perform(inq_condition_2, 'inq_last_6mths', self.X.loc[inq_condition_2, 'inq_fi'])
-            self._perform(inq_condition_2, 'inq_last_12m', self.X.loc[inq_condition_2, 'inq_fi'])
-        except ValueError:
-            pass
-        inq_condition_3 = \
-            (self.X.inq_last_6mths.isna() & self.X.inq_last_12m.isna())\
-            & (self.X.inq_fi.isna())
-        self._perform(inq_condition_3, drop_obs=True)
-        # open_acc
-        acc_condition_1_2 = \
-            (self.X.open_acc.isna() | self.X.total_acc.isna())\
-            & ((self.X.open_acc == 0) | (self.X.total_acc == 0))
-        self._perform(acc_condition_1_2, 'open_acc', 0)
-        self._perform(acc_condition_1_2, 'total_acc', 0)
-        acc_condition_3_4 = \
-            (self.X.open_acc.isna() | self.X.total_acc.isna())\
-            & ((self.X.open_acc > 0) | (self.X.total_acc > 0))
-        self._perform(acc_condition_3_4, drop_obs=True)
-        acc_condition_5 = \
-            self.X.open_acc.isna() & self.X.total_acc.isna()
-        self._perform(acc_condition_5, drop_obs=True)
-        # total_acc, tot_cur_bar
-        bal_condition_1_2 = \
-            (self.X.tot_cur_bal.isna() | self.X.total_acc.isna())\
-            & ((self.X.tot_cur_bal == 0) | (self.X.total_acc == 0))
-        self._perform(bal_condition_1_2, 'total_acc', 0)
-        self._perform(bal_condition_1_2, 'tot_cur_bal', 0)
-        bal_condition_3_4 = \
-            (self.X.tot_cur_bal.isna() | self.X.total_acc.isna())\
-            & ((self.X.tot_cur_bal > 0) | (self.X.total_acc > 0))
-        self._perform(bal_condition_3_4, drop_obs=True)
-        bal_condition_5 = \
-            self.X.tot_cur_bal.isna() & self.X.total_acc.isna()
-        self._perform(bal_condition_5, drop_obs=True)
-        # total_coll_amnt
-        coll_condition_1 = \
-            self.X.tot_coll_amt.isna() & self.X.collections_12_mths_ex_med.isna()
-        self._perform(coll_condition_1, drop_obs=True)
-        coll_condition_2_3 = \
-            (self.X.tot_coll_amt.isna() | (self.X.tot_coll_amt == 0))\
-            & (self.X.collections_12_mths_ex_med.isna() | (self.X.collections_12_mths_ex_med == 0))
-        self._perform(coll_condition_2_3, 'tot_coll_amt', 0)
-        self._perform(coll_condition_2_3, 'collections_12_mths_ex_med', 0)
-        coll_condition_4 = \
-            self.X.tot_coll_amt.isna() & (self.X.collections_12_mths_ex_med > 0)
-        self._perform(coll_condition_4, drop_obs=True)
-        coll_condition_5 = \
-            (self.X.tot_coll_amt == 0) & (self.X.collections_12_mths_ex_med.isna())
-        self._perform(coll_condition_5, drop_obs=True)
-        # open_il
-        open_il_condition_1 = \
-            (self.X.open_il_12m.isna() | self.X.open_il_24m.isna())\
-            & (self.X.mths_since_rcnt_il.isna())\
-            & (self.X.total_bal_il == 0)
-        self._perform(open_il_condition_1, 'mths_since_rcnt_il', 300)
-        self._perform(open_il_condition_1, 'open_il_12m', 0)
-        self._perform(open_il_condition_1, 'open_il_24m', 0)
-        open_il_condition_2 = \
-            (self.X.open_il_12m.isna() | self.X.open_il_24m.isna())\
-            & (self.X.mths_since_rcnt_il.isna())\
-            & (self.X.total_bal_il > 0)
-        self._perform(open_il_condition_2, drop_obs=True)
-        open_il_condition_3 = \
-            ((self.X.open_il_12m > 0) | (self.X.open_il_24m > 0))\
-            & (self.X.mths_since_rcnt_il.isna())\
-            & (self.X.total_bal_il > 0)
-        self._perform(open_il_condition_3, 'mths_since_rcnt_il', 1)
-        open_il_condition_4 = \
-            (self.X.open_il_12m.isna() & self.X.open_il_24m.isna())\
-            & (self.X.mths_since_rcnt_il.isna())\
-            & (self.X.total_bal_il.isna())
-        self._perform(open_il_condition_4, 'open_il_12m', 0) 
-        self._perform(open_il_condition_4, 'open_il_24m', 0) 
-        self._perform(open_il_condition_4, 'mths_since_rcnt_il', 300) 
-        self._perform(open_il_condition_4, 'total_bal_il', 0)
-        # total_bal_il
-        bal_il_condition_1 = \
-            (self.X.total_bal_il > 0)\
-            & (self.X.il_util.isna())
-        self._perform(bal_il_condition_1, drop_obs=True)
-        bal_il_condition_2 = \
-            (self.X.total_bal_il.isna())\
-            & (self.X.il_util > 0)
-        self._perform(bal_il_condition_2, drop_obs=True)
-        bal_il_condition_3 = \
-            (self.X.total_bal_il.isna())\
-            & (self.X.il_util == 0)
-        self._perform(bal_il_condition_3, 'total_bal_il', 0)
-        bal_il_condition_4 = \
-            (self.X.total_bal_il == 0)\
-            & (self.X.il_util.isna())
-        self._perform(bal_il_condition_4, 'il_util', 0)
-        bal_il_condition_5 = \
-            (self.X.total_bal_il.isna())\
-            & (self.X.il_util.isna())
-        self._perform(bal_il_condition_5, 'total_bal_il', 0)
-        self._perform(bal_il_condition_5, 'il_util', 0)
-        # revol_bal
-        revol_condition_1 = \
-            (self.X.revol_bal > 0)\
-            & (self.X.revol_util.isna())
-        self._perform(revol_condition_1, drop_obs=True)
-        revol_condition_2 = \
-            (self.X.revol_bal.isna())\
-            & (self.X.revol_util > 0)
-        self._perform(revol_condition_2, drop_obs=True)
-        revol_condition_3 = \
-            (self.X.revol_bal.isna())\
-            & (self.X.revol_util == 0)
-        self._perform(revol_condition_3, 'revol_bal', 0)
-        revol_condition_4 = \
-            (self.X.revol_bal == 0)\
-            & (self.X.revol_util.isna())
-        self._perform(revol_condition_4, 'revol_util', 0)
-        revol_condition_5 = \
-            (self.X.revol_bal.isna())\
-            & (self.X.revol_util.isna())
-        self._perform(revol_condition_5, 'revol_bal', 0)
-        self._perform(revol_condition_5, 'revol_util', 0)
+        with stage('LoanDataMissingHandler.transform', len(X)) as record:
+            predictor, label = self._transform(X)
+            record.set(rows_out=len(predictor))
+            return predictor, label
+
+    def _transform(self, X):
+        # all rules run over plain column arrays, observations to be dropped
+        # are only collected in `keep` and the frame is sliced once at the end
+        columns = _ColumnArrays(X)
+        keep = np.ones(len(X), dtype=bool)
+        for name, condition, replace in MISSING_RULES:
+            with stage(f'LoanDataMissingHandler.{name}') as record:
+                masking = condition(columns) & keep
+                if record.enabled:
+                    rows_in, matched = int(keep.sum()), int(masking.sum())
+                    record.set(rows_in=rows_in, rows_out=rows_in, cells_filled=0)
+                if replace is None:
+                    keep &= ~masking
+                    if record.enabled:
+                        record.set(rows_out=rows_in - matched)
+                    continue
+                for feature, replace_value in replace.items():
+                    replace_value = self._replace_value(replace_value)
+                    if not replace_value:
+                        continue
+                    columns.writable(feature, replace_value)[masking] = replace_value
+                    if record.enabled:
+                        record.record['cells_filled'] += matched
         ## Mandatory Features
-        mandatory_features = [
-            'annual_inc', 'dti', 'home_ownership',
-            'loan_amnt', 'term', 'int_rate', 'installment', 
-            'grade', 'sub_grade', 'pymnt_plan'
-            ]
-        for feature in mandatory_features:
-            try:
-                condition = self.X[feature].isna()
-                self._perform(condition, drop_obs=True)
-            except KeyError:
-                continue
+        with stage('LoanDataMissingHandler.mandatory_features') as record:
+            if record.enabled:
+                record.set(rows_in=int(keep.sum()))
+            for feature in MANDATORY_FEATURES:
+                try:
+                    keep &= ~_isna(columns[feature])
+                except KeyError:
+                    continue
+            if record.enabled:
+                record.set(rows_out=int(keep.sum()))
         ## replace missing values outside special conditions
-        # replace 0
-        replace_0 = [
-            'il_util', 'total_cu_tl', 'inq_last_12m', 'all_util', 'open_rv_24m', 'open_rv_12m', 'open_acc_6m', 
-            'total_bal_il', 'inq_fi', 'open_il_12m', 'open_il_24m', 'tot_coll_amt', 'tot_cur_bal', 'total_rev_hi_lim',
-            'revol_util', 'collections_12_mths_ex_med', 'pub_rec', 'acc_now_delinq', 'total_acc', 'open_acc', 'inq_last_6mths',
-            'delinq_2yrs', 'max_bal_bc'
-            ]
-        for feature in replace_0:
-            try:
-                self.X.loc[:, feature] = self.X.loc[:, feature].fillna(0)
-            except KeyError:
-                continue
-        replace_300 = [
-            'mths_since_rcnt_il', 'mths_since_last_record', 'mths_since_last_major_derog', 'mths_since_last_delinq',
-            ]
-        for feature in replace_300:
-            try:
-                self.X.loc[:, feature] = self.X.loc[:, feature].fillna(300)
-            except KeyError:
-                continue
-        label = self.X.loan_category.values
-        predictor = self.X.drop(columns=['loan_category']).reset_index(drop=True)
+        for stage_name, features, replace_value in [
+                ('replace_0', REPLACE_0_FEATURES, 0), ('replace_300', REPLACE_300_FEATURES, 300)]:
+            with stage(f'LoanDataMissingHandler.{stage_name}') as record:
+                if record.enabled:
+                    record.set(rows_in=int(keep.sum()))
+                cells_filled = 0
+                for feature in features:
+                    try:
+                        masking = _isna(columns[feature])
+                    except KeyError:
+                        continue
+                    if masking.any():
+                        columns.writable(feature)[masking] = replace_value
+                        if record.enabled:
+                            cells_filled += int((masking & keep).sum())
+                record.set(cells_filled=cells_filled)
+        with stage('LoanDataMissingHandler.take', len(X)) as record:
+            rows = np.flatnonzero(keep)
+            label = columns['loan_category'][rows]
+            predictor = X.take(rows)
+            del predictor['loan_category']
+            predictor.index = pd.RangeIndex(len(rows))
+            for feature in columns.written_:
+                values = columns[feature][rows]
+                if self.compact:
+                    values = values.astype(narrowest_dtype(values))
+                predictor[feature] = values
+            record.set(rows_out=len(rows))
         return predictor, label
 
 # class LoanDataMissingHandler(BaseEstimator, TransformerMixin):
@@ -0,0 +1,277 @@
+"""
+Feature drift monitor of the predictor columns (output of
+LoanDataMissingHandler.transform). Updates only need numpy, so it can be fed
+from the scoring runtime (modules.scoring_runtime) without pandas.
+"""
+import json
+import time
+
+import numpy as np
+
+_PSI_EPS = 1e-4
+
+
+def _as_float(values):
+    values = np.asarray(values)
+    if values.dtype.kind == 'M':
+        # NaT -> NaN, datetimes are binned on their nanoseconds
+        return np.where(np.isnat(values), np.nan, values.view('int64').astype('float64'))
+    return values.astype('float64')
+
+
+def _is_missing(value):
+    return value is None or (isinstance(value, float) and value != value)
+
+
+class _NumericCounter():
+    # buckets (-inf, e_0), [e_0, e_1), ..., [e_last, inf) and a NaN bucket
+    kind = 'numeric'
+
+    def __init__(self, edges):
+        self.edges = np.asarray(edges, dtype='float64')
+        self.n_buckets = len(self.edges) + 2
+
+    @classmethod
+    def from_reference(cls, values, n_bins):
+        values = _as_float(values)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return cls([])
+        quantiles = np.quantile(values, np.linspace(0, 1, n_bins + 1)[1:-1])
+        return cls(np.unique(quantiles))
+
+    def buckets(self, values):
+        values = _as_float(values)
+        buckets = np.searchsorted(self.edges, values, side='right')
+        buckets[np.isnan(values)] = self.n_buckets - 1
+        return buckets
+
+    def labels(self):
+        edges = [-np.inf] + self.edges.tolist() + [np.inf]
+        return [f'[{low:g}, {high:g})' for low, high in zip(edges[:-1], edges[1:])] + ['NaN']
+
+    def to_dict(self):
+        return {'kind': self.kind, 'edges': self.edges.tolist()}
+
+
+class _CategoryCounter():
+    # one bucket per reference category, then `other` and NaN buckets
+    kind = 'categorical'
+
+    def __init__(self, categories, ordered=False):
+        self.categories = list(categories)
+        self.ordered = ordered
+        self.index = {category: i for i, category in enumerate(self.categories)}
+        self.n_buckets = len(self.categories) + 2
+
+    @classmethod
+    def from_reference(cls, values, max_categories):
+        import pandas as pd
+
+        values = pd.Series(values)
+        ordered = isinstance(values.dtype, pd.CategoricalDtype) and values.dtype.ordered
+        if ordered:
+            categories = list(values.dtype.categories)
+        else:
+            categories = values.value_counts().index[:max_categories].tolist()
+        return cls(categories, ordered)
+
+    def buckets(self, values):
+        other, missing = len(self.categories), len(self.categories) + 1
+        categories = getattr(values, 'categories', None)
+        if categories is not None:
+            # pandas Categorical, only its categories are looked up
+            lookup = np.array(
+                [self.index.get(category, other) for category in categories] + [missing])
+            return lookup[np.asarray(values.codes)]
+        return np.fromiter(
+            (missing if _is_missing(value) else self.index.get(value, other)
+             for value in values),
+            dtype='int64', count=len(values))
+
+    def labels(self):
+        return [str(category) for category in self.categories] + ['other', 'NaN']
+
+    def to_dict(self):
+        return {'kind': self.kind, 'categories': self.categories, 'ordered': self.ordered}
+
+
+def _counter_from_dict(state):
+    if state['kind'] == 'numeric':
+        return _NumericCounter(state['edges'])
+    return _CategoryCounter(state['categories'], state['ordered'])
+
+
+class DriftMonitor():
+    """
+    Fixed-bucket drift monitor of the predictor columns.
+
+    `fit` captures, on the training predictor, decile buckets (`n_bins`) of
+    every numeric feature and the `max_categories` most frequent categories
+    of every other feature (all categories of ordered ones), each with a
+    NaN bucket and categories an `other` bucket. `update` (a predictor
+    frame or dict of arrays) and `update_records` (the values dicts of the
+    scoring runtime) only add bucket counts, so the memory per feature is
+    constant whatever the traffic. `report` compares the counts since the
+    last `reset` with the reference on demand: population stability index
+    (PSI) and the largest gap between the reference and current cumulative
+    distributions over the buckets (KS, numeric and ordered features).
+
+    The time spent in updates is kept in `cost_`.
+
+    Parameters
+    ----------
+    n_bins: number of reference quantile buckets of numeric features
+    max_categories: number of reference categories kept per feature
+    psi_threshold: PSI above which a feature is reported as drifted
+    """
+    def __init__(self, n_bins=10, max_categories=50, psi_threshold=0.2):
+        self.n_bins = n_bins
+        self.max_categories = max_categories
+        self.psi_threshold = psi_threshold
+
+    def fit(self, X, y=None):
+        """Reference buckets and counts of the predictor X."""
+        self.counters_ = {}
+        for feature in X.columns:
+            values = X[feature]
+            if values.dtype.kind in 'biufM':
+                self.counters_[feature] = _NumericCounter.from_reference(
+                    values.to_numpy(), self.n_bins)
+            else:
+                self.counters_[feature] = _CategoryCounter.from_reference(
+                    values, self.max_categories)
+        self.reference_counts_ = {
+            feature: self._count(counter, X[feature])
+            for feature, counter in self.counters_.items()
+            }
+        self.reset()
+        return self
+
+    def reset(self):
+        """Start a new monitoring window."""
+        self.counts_ = {
+            feature: np.zeros(counter.n_buckets, dtype='int64')
+            for feature, counter in self.counters_.items()
+            }
+        self.cost_ = {'batches': 0, 'rows': 0, 'seconds': 0.}
+        return self
+
+    @staticmethod
+    def _count(counter, values):
+        values = getattr(values, 'array', values)
+        return np.bincount(counter.buckets(values), minlength=counter.n_buckets)
+
+    def update(self, X):
+        """Add the rows of X (predictor frame or dict of arrays) to the counts."""
+        start = time.perf_counter()
+        n_rows = 0
+        for feature, counter in self.counters_.items():
+            if feature in X:
+                values = X[feature]
+                self.counts_[feature] += self._count(counter, values)
+                n_rows = len(values)
+        self._add_cost(n_rows, start)
+        return self
+
+    def update_records(self, records):
+        """Add the values dicts of scored records, e.g. of `transform_many`."""
+        start = time.perf_counter()
+        numeric = [
+            feature for feature, counter in self.counters_.items()
+            if counter.kind == 'numeric'
+            ]
+        # one (rows, numeric features) array, None becomes NaN
+        matrix = np.array(
+            [[record.get(feature) for feature in numeric] for record in records],
+            dtype='float64').reshape(len(records), len(numeric))
+        for feature, counter in self.counters_.items():
+            if counter.kind == 'numeric':
+                values = matrix[:, numeric.index(feature)]
+            else:
+                values = [record.get(feature) for record in records]
+            self.counts_[feature] += np.bincount(
+                counter.buckets(values), minlength=counter.n_buckets)
+        self._add_cost(len(records), start)
+        return self
+
+    def _add_cost(self, n_rows, start):
+        self.cost_['batches'] += 1
+        self.cost_['rows'] += n_rows
+        self.cost_['seconds'] += time.perf_counter() - start
+
+    def report(self):
+        """PSI and KS of every feature over the current window, most drifted first."""
+        import pandas as pd
+
+        rows = {}
+        for feature, counter in self.counters_.items():
+            reference, current = self.reference_counts_[feature], self.counts_[feature]
+            n_reference, n_current = reference.sum(), current.sum()
+            row = {
+                'kind': counter.kind, 'n_reference': n_reference, 'n_current': n_current,
+                'psi': np.nan, 'ks': np.nan,
+                'nan_reference': reference[-1] / max(n_reference, 1),
+                'nan_current': current[-1] / max(n_current, 1),
+                }
+            if n_reference and n_current:
+                expected = np.maximum(reference / n_reference, _PSI_EPS)
+                actual = np.maximum(current / n_current, _PSI_EPS)
+                row['psi'] = float(np.sum((actual - expected) * np.log(actual / expected)))
+                if (counter.kind == 'numeric') or counter.ordered:
+                    # over the ordered buckets, without the NaN (and other) ones
+                    n_ordered = counter.n_buckets - (1 if counter.kind == 'numeric' else 2)
+                    reference, current = reference[:n_ordered], current[:n_ordered]
+                    if reference.sum() and current.sum():
+                        row['ks'] = float(np.max(np.abs(
+                            np.cumsum(reference) / reference.sum()
+                            - np.cumsum(current) / current.sum())))
+            rows[feature] = row
+        report = pd.DataFrame.from_dict(rows, orient='index')
+        report['drifted'] = report.psi > self.psi_threshold
+        return report.sort_values('psi', ascending=False)
+
+    def histogram(self, feature):
+        """Reference and current shares of every bucket of `feature`."""
+        import pandas as pd
+
+        counter = self.counters_[feature]
+        reference, current = self.reference_counts_[feature], self.counts_[feature]
+        return pd.DataFrame({
+            'reference': reference / max(reference.sum(), 1),
+            'current': current / max(current.sum(), 1),
+            }, index=counter.labels())
+
+    def save(self, path):
+        """Buckets and reference counts as JSON, the current window is not kept."""
+        state = {
+            'params': {
+                'n_bins': self.n_bins, 'max_categories': self.max_categories,
+                'psi_threshold': self.psi_threshold,
+                },
+            'counters': {
+                feature: {
+                    **counter.to_dict(),
+                    'reference_counts': self.reference_counts_[feature].tolist(),
+                    }
+                for feature, counter in self.counters_.items()
+                },
+            }
+        with open(path, 'w') as f:
+            json.dump(state, f, default=str)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            state = json.load(f)
+        monitor = cls(**state['params'])
+        monitor.counters_ = {
+            feature: _counter_from_dict(counter)
+            for feature, counter in state['counters'].items()
+            }
+        monitor.reference_counts_ = {
+            feature: np.asarray(counter['reference_counts'], dtype='int64')
+            for feature, counter in state['counters'].items()
+            }
+        return monitor.reset()
@@ -0,0 +1,63 @@
+from sklearn.base import BaseEstimator, TransformerMixin
+import pandas as pd
+import numpy as np
+
+def _add_stats(stats, batch_stats):
+    if stats is None:
+        return batch_stats
+    return stats.add(batch_stats, fill_value=0).sort_index()
+
+def _average(stats, name):
+    # sub grades without observations average to NaN, as a groupby mean
+    with np.errstate(divide='ignore', invalid='ignore'):
+        average = stats['sum'] / stats['count']
+    return average.rename(name).reset_index()
+
+class LoanFeatureExtract(BaseEstimator, TransformerMixin):
+    def __init__(self):
+        pass
+
+    def _reset_statistics(self):
+        self.recovery_stats_ = None
+        self.defaulted_stats_ = None
+
+    def fit(self, X, y):
+        self._reset_statistics()
+        return self.partial_fit(X, y)
+
+    def partial_fit(self, X, y):
+        """
+        Fold the loans of X into the per sub grade sums and counts, the
+        fitted averages are the same as a `fit` over all loans seen so far.
+        """
+        if not hasattr(self, 'recovery_stats_'):
+            self._reset_statistics()
+        X = X.assign(
+            portion_paid=lambda x: x.total_rec_prncp / x.loan_amnt
+            )
+        bad_loan_mask = np.where(y == 'Bad Loan')[0]
+        map_loan_cat = {'Good Loan': 0, 'Bad Loan': 1}
+        recovery_stats = X.iloc[bad_loan_mask, :]\
+            .groupby('sub_grade')['portion_paid']\
+            .agg(['sum', 'count'])
+        defaulted_stats = \
+            pd.merge(X[['sub_grade']],
+                     pd.DataFrame(y, columns=['loan_category']).apply(lambda x: x.map(map_loan_cat)),
+                     left_index=True, right_index=True)\
+                .groupby('sub_grade')['loan_category']\
+                .agg(['sum', 'count'])
+        self.recovery_stats_ = _add_stats(self.recovery_stats_, recovery_stats)
+        self.defaulted_stats_ = _add_stats(self.defaulted_stats_, defaulted_stats)
+        self.avg_defaulted_recovery_ = _average(self.recovery_stats_, 'avg_defaulted_recovery')
+        self.portion_defaulted_ = _average(self.defaulted_stats_, 'avg_portion_defaulted')
+        return self
+
+    def transform(self, X, y=None):
+        X = pd.merge(
+            X, self.avg_defaulted_recovery_, how='left', on='sub_grade'
+            )
+        X = pd.merge(
+            X, self.portion_defaulted_, how='left', on='sub_grade'
+            )
+        X = X.drop(columns=['total_rec_prncp'])
+        return X
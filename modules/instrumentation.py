@@ -0,0 +1,181 @@
+import contextvars
+import time
+
+import pandas as pd
+
+_active = contextvars.ContextVar('instrumentation', default=None)
+
+
+def _rss_status(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field):
+                return int(line.split()[1]) * 1024
+    return None
+
+
+# peak measurements in progress, innermost last
+_open_peaks = []
+
+
+def _reset_peak_rss():
+    # Linux only, resets VmHWM to the current resident set size after
+    # carrying the peak so far up to the measurements in progress
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            _carry_peak_up()
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _carry_peak_up():
+    peak = _rss_status('VmHWM:')
+    for measurement in _open_peaks:
+        measurement.peak = max(measurement.peak, peak)
+
+
+class _PeakRss():
+    """
+    Peak resident set size of a block above the one before it (Linux only).
+    Every reset of the process-wide VmHWM first carries the peak so far up
+    to the measurements in progress, so nested measurements (stages inside
+    BenchmarkRun.measure) do not hide the peak of the enclosing ones.
+    """
+    def __init__(self):
+        self.rss_before = None
+        self.peak = 0
+
+    def start(self):
+        _reset_peak_rss()
+        self.rss_before = _rss_status('VmRSS:')
+        _open_peaks.append(self)
+
+    def stop(self):
+        """Peak bytes above the resident set size at the start."""
+        _carry_peak_up()
+        _open_peaks.remove(self)
+        return max(self.peak - self.rss_before, 0)
+
+
+class _NullStage():
+    """Stage handed out while no instrumentation is active, records nothing."""
+    enabled = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **fields):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+def stage(name, rows_in=None):
+    """
+    Context manager measuring the block as stage `name` of the active
+    PipelineInstrumentation, a shared no-op one if none is active. Values
+    only needed for the record (rows out, cells filled) should be computed
+    under `if record.enabled:`.
+    """
+    instrumentation = _active.get()
+    if instrumentation is None:
+        return _NULL_STAGE
+    return _Stage(instrumentation, name, rows_in)
+
+
+class _Stage():
+    enabled = True
+
+    def __init__(self, instrumentation, name, rows_in):
+        self.instrumentation = instrumentation
+        self.record = {
+            'stage': name, 'wall_time': None, 'peak_bytes': None,
+            'rows_in': rows_in, 'rows_out': None, 'cells_filled': None,
+            }
+        self.peak_rss = _PeakRss()
+
+    def set(self, **fields):
+        self.record.update(fields)
+
+    def __enter__(self):
+        stack = self.instrumentation._stack
+        self.record['depth'] = len(stack)
+        stack.append(self)
+        if self.instrumentation.memory:
+            self.peak_rss.start()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.record['wall_time'] = time.perf_counter() - self.start
+        stack = self.instrumentation._stack
+        stack.pop()
+        if self.instrumentation.memory:
+            self.record['peak_bytes'] = self.peak_rss.stop()
+        if (self.record['rows_out'] is None) and (exc_info[0] is None):
+            self.record['rows_out'] = self.record['rows_in']
+        self.instrumentation._add(self.record)
+        return False
+
+
+class PipelineInstrumentation():
+    """
+    Opt-in measurements of the preprocessing transformers. While active
+    (`with PipelineInstrumentation() as instrumentation:`), every stage of
+    LoanDataPreprocess, LoanDataLabelPredictor and LoanDataMissingHandler,
+    down to every named rule of MISSING_RULES, records its wall time, peak
+    memory, rows in and out and cells filled (and the frame memory in and out
+    of a `compact=True` LoanDataPreprocess). When no instrumentation is
+    active, the transformers only pay a context variable lookup per stage.
+
+    Parameters
+    ----------
+    callback: callable(record) called with the record dict of every finished
+        stage, e.g. a metrics exporter
+    memory: measure the peak resident set size of every stage (Linux only)
+    """
+    def __init__(self, callback=None, memory=True):
+        self.callback = callback
+        self.memory = memory and _reset_peak_rss()
+        self.records = []
+        self._stack = []
+        self._token = None
+
+    def __enter__(self):
+        self._token = _active.set(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        _active.reset(self._token)
+        self._token = None
+        return False
+
+    def _add(self, record):
+        self.records.append(record)
+        if self.callback is not None:
+            self.callback(record)
+
+    def report(self):
+        """One row per finished stage, in the order they finished."""
+        return pd.DataFrame(
+            self.records,
+            columns=[
+                'stage', 'depth', 'wall_time', 'peak_bytes', 'rows_in', 'rows_out',
+                'cells_filled', 'frame_bytes_in', 'frame_bytes_out',
+                ])
+
+    def summary(self):
+        """Totals per stage over every recorded batch, slowest first."""
+        report = self.report()
+        summary = report.groupby('stage', sort=False).agg(
+            calls=('wall_time', 'size'), wall_time=('wall_time', 'sum'),
+            peak_bytes=('peak_bytes', 'max'), rows_in=('rows_in', 'sum'),
+            rows_out=('rows_out', 'sum'), cells_filled=('cells_filled', 'sum'))
+        summary['rows_dropped'] = summary.rows_in - summary.rows_out
+        return summary.sort_values('wall_time', ascending=False)
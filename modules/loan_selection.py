@@ -0,0 +1,358 @@
+import pandas as pd
+import numpy as np
+
+
+def _integer_weights(weight, constraint):
+    """
+    Weights and capacity (or array of capacities) divided by their gcd, None
+    if weights are not integral.
+    """
+    if not np.all(np.isfinite(weight)) or not np.all(weight == np.round(weight)):
+        return None
+    int_weight = weight.astype('int64')
+    divisor = np.gcd.reduce(int_weight[int_weight > 0]) if np.any(int_weight > 0) else 1
+    capacity = np.floor(np.asarray(constraint) / divisor).astype('int64')
+    return int_weight // divisor, (capacity if capacity.ndim else int(capacity))
+
+
+def _knapsack_dp(value, weight, capacity):
+    # dp[c] is the best value within capacity c, keep[i, c] whether item i
+    # is taken in that solution
+    n = len(value)
+    dp = np.zeros(capacity + 1)
+    keep = np.zeros((n, capacity + 1), dtype=bool)
+    for i in range(n):
+        w = weight[i]
+        candidate = dp[:(capacity + 1 - w)] + value[i]
+        take = candidate > dp[w:]
+        keep[i, w:] = take
+        dp[w:][take] = candidate[take]
+    selected = []
+    c = capacity
+    for i in range(n - 1, -1, -1):
+        if keep[i, c]:
+            selected.append(i)
+            c -= weight[i]
+    return np.array(selected[::-1], dtype='int64')
+
+
+def _knapsack_dp_frontier(value, weight, capacities):
+    # one `_knapsack_dp` pass up to the largest capacity: dp[:c + 1] and
+    # keep[:, :c + 1] are those of the pass up to c, so the keep rows are
+    # stored as bits and backtracked for every capacity at once
+    capacity = int(np.max(capacities))
+    n = len(value)
+    dp = np.zeros(capacity + 1)
+    keep = np.zeros((n, (capacity + 8) // 8), dtype='uint8')
+    row = np.zeros(capacity + 1, dtype=bool)
+    for i in range(n):
+        w = weight[i]
+        candidate = dp[:(capacity + 1 - w)] + value[i]
+        take = candidate > dp[w:]
+        row[:w] = False
+        row[w:] = take
+        keep[i] = np.packbits(row)
+        dp[w:][take] = candidate[take]
+    c = np.array(capacities, dtype='int64')
+    selected = np.zeros((n, len(c)), dtype=bool)
+    for i in range(n - 1, -1, -1):
+        taken = (keep[i, c >> 3] >> (7 - (c & 7))) & 1
+        selected[i] = taken
+        c -= weight[i] * taken
+    return selected
+
+
+def _knapsack_bnb(value, weight, capacity):
+    # depth-first branch and bound over items sorted by value density, bounded
+    # by the greedy LP relaxation (Horowitz-Sahni)
+    order = np.argsort(-value / weight, kind='stable')
+    v = value[order].tolist()
+    w = weight[order].tolist()
+    n = len(v)
+    taken = []
+    best, best_taken = 0., []
+    c, z, j = capacity, 0., 0
+    while True:
+        if j < n:
+            remaining, bound, r = c, 0., j
+            while r < n and w[r] <= remaining:
+                remaining -= w[r]
+                bound += v[r]
+                r += 1
+            if r < n:
+                bound += remaining * v[r] / w[r]
+            if z + bound > best:
+                for k in range(j, r):
+                    c -= w[k]
+                    z += v[k]
+                    taken.append(k)
+                j = r + 1 # item r does not fit, explore without it
+                continue
+        elif z > best:
+            best, best_taken = z, list(taken)
+        # backtrack: drop the last taken item and explore without it
+        if not taken:
+            break
+        k = taken.pop()
+        c += w[k]
+        z -= v[k]
+        j = k + 1
+    return np.sort(order[best_taken]).astype('int64')
+
+
+def get_loan_choice(value, weight, constraint, method='auto', max_dp_cells=5e7):
+    """
+    Solves the 0/1 knapsack of picking loans: maximize the sum of `value`
+    of the selected loans with their total `weight` within `constraint`.
+
+    Integral weights (e.g. `loan_amnt`) are solved exactly by dynamic
+    programming over the weights divided by their gcd, otherwise (or when the
+    table would exceed `max_dp_cells`) by branch and bound.
+
+    Parameters
+    ----------
+    value: ArrayLike with shape (n, )
+    weight: ArrayLike with shape (n, )
+    constraint: Scalar
+    method: 'auto', 'dp' or 'bnb'
+
+    Returns
+    -------
+    selected_loan_idx: sorted index of the loans to buy
+    """
+    value = np.asarray(value, dtype='float64')
+    weight = np.asarray(weight, dtype='float64')
+    # loans without positive value never improve the objective, loans above
+    # the budget never fit
+    candidate = np.flatnonzero((value > 0) & (weight <= constraint))
+    if len(candidate) == 0:
+        return np.array([], dtype='int64')
+    value, weight = value[candidate], weight[candidate]
+    free = weight <= 0
+    selected = [candidate[free]]
+    value, weight, candidate = value[~free], weight[~free], candidate[~free]
+    if len(candidate):
+        integer_weights = _integer_weights(weight, constraint)
+        if method == 'auto':
+            method = 'bnb' if (integer_weights is None) \
+                or (len(value) * (integer_weights[1] + 1) > max_dp_cells) else 'dp'
+        if method == 'dp':
+            if integer_weights is None:
+                raise ValueError('dynamic programming needs integral weights')
+            selected.append(candidate[_knapsack_dp(value, *integer_weights)])
+        elif method == 'bnb':
+            selected.append(candidate[_knapsack_bnb(value, weight, constraint)])
+        else:
+            raise ValueError(f'unknown method {method}')
+    return np.sort(np.concatenate(selected)).astype('int64')
+
+
+def get_loan_frontier(value, weight, budgets, method='auto', max_dp_cells=4e8):
+    """
+    Solves the knapsack of `get_loan_choice` for every budget of `budgets`.
+
+    Integral weights are solved by a single dynamic programming pass up to
+    the largest budget, which holds the optimum of every smaller budget; the
+    keep table is stored as bits (`max_dp_cells` bounds their number) and
+    the selections of all budgets are backtracked together. The selections
+    are those `get_loan_choice(value, weight, budget, method='dp')` returns.
+    Otherwise every budget is solved by branch and bound.
+
+    Parameters
+    ----------
+    value: ArrayLike with shape (n, )
+    weight: ArrayLike with shape (n, )
+    budgets: ArrayLike with shape (m, )
+    method: 'auto', 'dp' or 'bnb'
+
+    Returns
+    -------
+    objective: total value of the selection of every budget, shape (m, )
+    selected: boolean array with shape (n, m), `selected[:, j]` are the
+        loans to buy within `budgets[j]`
+    """
+    value = np.asarray(value, dtype='float64')
+    weight = np.asarray(weight, dtype='float64')
+    budgets = np.asarray(budgets, dtype='float64')
+    selected = np.zeros((len(value), len(budgets)), dtype=bool)
+    candidate = np.flatnonzero((value > 0) & (weight <= budgets.max(initial=-np.inf)))
+    if len(candidate):
+        value_, weight_ = value[candidate], weight[candidate]
+        free = weight_ <= 0
+        selected[candidate[free]] = weight_[free, None] <= budgets
+        value_, weight_, candidate = value_[~free], weight_[~free], candidate[~free]
+    if len(candidate):
+        integer_weights = _integer_weights(weight_, np.maximum(budgets, 0))
+        if method == 'auto':
+            method = 'bnb' if (integer_weights is None) \
+                or (len(value_) * (integer_weights[1].max() + 1) > max_dp_cells) else 'dp'
+        if method == 'dp':
+            if integer_weights is None:
+                raise ValueError('dynamic programming needs integral weights')
+            selected[candidate] = _knapsack_dp_frontier(value_, *integer_weights) \
+                & (budgets >= 0)
+        elif method == 'bnb':
+            for j, budget in enumerate(budgets):
+                fits = weight_ <= budget
+                if fits.any():
+                    selected[candidate[fits][
+                        _knapsack_bnb(value_[fits], weight_[fits], budget)], j] = True
+        else:
+            raise ValueError(f'unknown method {method}')
+    objective = np.where(selected, value[:, None], 0.).sum(axis=0)
+    return objective, selected
+
+
+def get_loan_choice_pyomo(value, weight, constraint, solver='scip'):
+    """
+    Reference formulation of `get_loan_choice` with Pyomo, solved by an
+    external MIP solver. Kept to cross-check the native solvers.
+
+    Parameters
+    ----------
+    value: ArrayLike with shape (n, )
+    weight: ArrayLike with shape (n, )
+    constraint: Scalar
+    """
+    import pyomo.environ as pyo
+
+    def obj_rule(model_):
+        return sum(model_.v[i] * model_.x[i] for i in model_.i)
+
+    def const_rule(model_):
+        return (sum(model_.w[i] * model_.x[i] for i in model_.i) <= model_.W)
+
+    n = len(value)
+    i_ = np.arange(n)
+    value_map = dict(zip(i_, value))   # need to create dictionary
+    weight_map = dict(zip(i_, weight)) # this is due to pyomo structure is dict-like
+    # pyo model
+    model = pyo.ConcreteModel()
+    model.i = pyo.RangeSet(0, (n - 1))
+    model.v = pyo.Param(model.i, initialize=value_map, within=pyo.NonNegativeReals)
+    model.w = pyo.Param(model.i, initialize=weight_map, within=pyo.NonNegativeReals)
+    model.x = pyo.Var(model.i, within=pyo.NonNegativeIntegers, bounds=(0, 1))
+    model.W = pyo.Param(initialize=constraint)
+    model.OBJ = pyo.Objective(rule=obj_rule, sense=pyo.maximize)
+    model.CONST = pyo.Constraint(rule=const_rule)
+    # start the solver
+    opt = pyo.SolverFactory(solver, solver_io='nl')
+    opt.solve(model)
+    loan_mask = [v_() for v_ in model.x.values()]
+    selected_loan_idx = i_[np.argwhere(loan_mask)].flatten()
+    # return the index of loan to buy
+    return selected_loan_idx
+
+
+# Loan selectors. `df` is a DataFrame or a dict of arrays with the columns
+# `loan_amnt`, `int_rate`, `grade`, `potential_return`, `actual_return` and
+# `proba_bad_loan`.
+def _column(df, name, mask=None):
+    values = np.asarray(df[name])
+    if mask is not None:
+        return values[mask]
+    return values
+
+
+def _select(budget, df, value, mask=None, return_total_funding=False):
+    weight = _column(df, 'loan_amnt', mask)
+    actual_return = _column(df, 'actual_return', mask)
+    if len(weight) == 0:
+        net_return, total_funding = 0, 0
+    else:
+        loan_idx = get_loan_choice(value, weight, budget)
+        net_return = actual_return[loan_idx].sum()
+        total_funding = weight[loan_idx].sum()
+    if return_total_funding:
+        return net_return, total_funding
+    return net_return
+
+
+def _inputs_a(df):
+    return _column(df, 'potential_return'), None
+
+
+def _inputs_b(df):
+    mask = np.isin(_column(df, 'grade'), ['A', 'B'])
+    return _column(df, 'potential_return', mask), mask
+
+
+def _inputs_c(df):
+    value_ratio = (1 - _column(df, 'proba_bad_loan')) * (1 + _column(df, 'int_rate') / 100)
+    mask = value_ratio > 1
+    return value_ratio[mask], mask
+
+
+def _inputs_d(df, treshold=0.5, value_choice='potential_return'):
+    proba_bad_loan = _column(df, 'proba_bad_loan')
+    mask = proba_bad_loan < treshold
+    if value_choice == 'proba_bad_loan':
+        value = 1 - proba_bad_loan[mask]
+    elif value_choice == 'potential_return':
+        value = _column(df, 'potential_return', mask)
+    return value, mask
+
+
+def SelectorA(budget, df, return_total_funding=False):
+    """Non-informed decision, maximizes the potential return."""
+    return _select(budget, df, *_inputs_a(df), return_total_funding)
+
+
+def SelectorB(budget, df, return_total_funding=False):
+    """Minimal-informed decision, only grade A and B loans."""
+    return _select(budget, df, *_inputs_b(df), return_total_funding)
+
+
+def SelectorC(budget, df, return_total_funding=False):
+    """Model-informed decision, maximizes the expected value ratio."""
+    return _select(budget, df, *_inputs_c(df), return_total_funding)
+
+
+def SelectorD(budget, df, return_total_funding=False, treshold=0.5, value_choice='potential_return'):
+    """Model-informed decision, only loans below the `treshold` probability."""
+    return _select(budget, df, *_inputs_d(df, treshold, value_choice), return_total_funding)
+
+
+_SELECTOR_INPUTS = {
+    SelectorA: _inputs_a, SelectorB: _inputs_b, SelectorC: _inputs_c, SelectorD: _inputs_d,
+    }
+
+
+def loan_frontier(selector, budgets, df, **selector_kws):
+    """
+    Efficient frontier of a selector: its selection for every budget of
+    `budgets` from one `get_loan_frontier` solve, instead of one solve per
+    budget.
+
+    Parameters
+    ----------
+    selector: SelectorA, SelectorB, SelectorC or SelectorD
+    budgets: ArrayLike of budgets, e.g. `np.arange(0, 1000001, 10000)`
+    df: DataFrame or dict of arrays, as for the selectors
+    selector_kws: keyword arguments of the selector, e.g. `treshold`
+
+    Returns
+    -------
+    frontier: DataFrame indexed by budget with the `objective` the selector
+        maximizes, the `net_return` and `total_funding` its selectors return
+        and the number of selected loans `n_loans`
+    selected: boolean array with shape (len(df), len(budgets)) of the loans
+        selected within every budget
+    """
+    value, mask = _SELECTOR_INPUTS[selector](df, **selector_kws)
+    weight = _column(df, 'loan_amnt')
+    actual_return = _column(df, 'actual_return')
+    rows = np.arange(len(weight)) if mask is None else np.flatnonzero(mask)
+    budgets = np.asarray(budgets)
+    selected = np.zeros((len(weight), len(budgets)), dtype=bool)
+    objective = np.zeros(len(budgets))
+    if len(rows):
+        objective, selected_rows = get_loan_frontier(value, weight[rows], budgets)
+        selected[rows] = selected_rows
+    frontier = pd.DataFrame({
+        'objective': objective,
+        'net_return': np.where(selected, actual_return[:, None], 0).sum(axis=0),
+        'total_funding': np.where(selected, weight[:, None], 0).sum(axis=0),
+        'n_loans': selected.sum(axis=0),
+        }, index=pd.Index(budgets, name='budget'))
+    return frontier, selected
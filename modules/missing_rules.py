@@ -0,0 +1,181 @@
+"""
+Imputation rules of LoanDataMissingHandler. They only need the standard
+library on scalars, so the scoring runtime (modules.scoring_runtime) can run
+them without importing pandas or scikit-learn.
+"""
+
+def _isna(values):
+    # rules also run on the scalars of a single record (modules.scoring), the
+    # scoring runtime must not import pandas for them
+    if isinstance(values, (float, int)):
+        return values != values
+    if values is None:
+        return True
+    import pandas as pd
+    return pd.isna(values)
+
+# Imputation rules of LoanDataMissingHandler, evaluated top to bottom.
+# Each rule is (name, condition, replace): `condition` takes the current column
+# arrays and returns a boolean mask, `replace` maps feature -> replace value
+# (a string refers to a fitted attribute) or is None to drop the observations.
+# Falsy replace values are kept for reference but never written, the same as
+# the former `_perform` cascade did (the remaining NaNs are filled at the end).
+# Bump MISSING_RULES_VERSION whenever a rule changes, it invalidates caches.
+MISSING_RULES_VERSION = 1
+MISSING_RULES = [
+    # mths_since_last_record
+    ('rec_condition_1',
+     lambda c: _isna(c['mths_since_last_record']) & (c['pub_rec'] == 0),
+     {'mths_since_last_record': 300}),
+    ('rec_condition_2',
+     lambda c: _isna(c['mths_since_last_record']) & (c['pub_rec'] > 0),
+     {'mths_since_last_record': 1}),
+    ('rec_condition_3',
+     lambda c: _isna(c['mths_since_last_record']) & _isna(c['pub_rec']),
+     None),
+    # mths_since_last_delinq
+    ('last_delinq_condition_1',
+     lambda c: _isna(c['mths_since_last_delinq'])
+        & (c['delinq_2yrs'] == 0) & (c['acc_now_delinq'] == 0),
+     {'mths_since_last_delinq': 300}),
+    ('last_delinq_condition_2',
+     lambda c: _isna(c['mths_since_last_delinq'])
+        & (c['delinq_2yrs'] > 0) & (c['acc_now_delinq'] > 0),
+     {'mths_since_last_delinq': 1}),
+    ('last_delinq_condition_3',
+     lambda c: _isna(c['mths_since_last_delinq'])
+        & (c['delinq_2yrs'] > 0) & (c['acc_now_delinq'] == 0),
+     {'mths_since_last_delinq': 'median_cond_3_'}),
+    ('last_delinq_condition_4',
+     lambda c: (c['mths_since_last_delinq'] == 0)
+        & (c['delinq_2yrs'] > 0) & (c['acc_now_delinq'] == 0),
+     {'mths_since_last_delinq': 'median_cond_3_'}),
+    ('last_delinq_condition_5',
+     lambda c: (c['mths_since_last_delinq'] > 0) & (c['mths_since_last_delinq'] < 25)
+        & (c['delinq_2yrs'] == 0) & (c['acc_now_delinq'] == 0),
+     {'delinq_2yrs': 1}),
+    ('last_delinq_condition_6',
+     lambda c: (c['mths_since_last_delinq'] == 0)
+        & (c['delinq_2yrs'] == 0) & (c['acc_now_delinq'] == 0),
+     {'mths_since_last_delinq': 300}),
+    ('last_delinq_condition_7',
+     lambda c: _isna(c['mths_since_last_delinq'])
+        & _isna(c['delinq_2yrs']) & _isna(c['acc_now_delinq']),
+     None),
+    # inq_last_{6mths, 12mths}
+    # inq_condition_2 (copy `inq_fi` where it is > 0) is not listed: the former
+    # cascade passed a Series as replace value and swallowed the ValueError.
+    ('inq_condition_1',
+     lambda c: (_isna(c['inq_last_6mths']) | _isna(c['inq_last_12m']))
+        & (c['inq_fi'] == 0),
+     {'inq_last_6mths': 0, 'inq_last_12m': 0}),
+    ('inq_condition_3',
+     lambda c: _isna(c['inq_last_6mths']) & _isna(c['inq_last_12m'])
+        & _isna(c['inq_fi']),
+     None),
+    # open_acc
+    ('acc_condition_1_2',
+     lambda c: (_isna(c['open_acc']) | _isna(c['total_acc']))
+        & ((c['open_acc'] == 0) | (c['total_acc'] == 0)),
+     {'open_acc': 0, 'total_acc': 0}),
+    ('acc_condition_3_4',
+     lambda c: (_isna(c['open_acc']) | _isna(c['total_acc']))
+        & ((c['open_acc'] > 0) | (c['total_acc'] > 0)),
+     None),
+    ('acc_condition_5',
+     lambda c: _isna(c['open_acc']) & _isna(c['total_acc']),
+     None),
+    # total_acc, tot_cur_bal
+    ('bal_condition_1_2',
+     lambda c: (_isna(c['tot_cur_bal']) | _isna(c['total_acc']))
+        & ((c['tot_cur_bal'] == 0) | (c['total_acc'] == 0)),
+     {'total_acc': 0, 'tot_cur_bal': 0}),
+    ('bal_condition_3_4',
+     lambda c: (_isna(c['tot_cur_bal']) | _isna(c['total_acc']))
+        & ((c['tot_cur_bal'] > 0) | (c['total_acc'] > 0)),
+     None),
+    ('bal_condition_5',
+     lambda c: _isna(c['tot_cur_bal']) & _isna(c['total_acc']),
+     None),
+    # tot_coll_amt
+    ('coll_condition_1',
+     lambda c: _isna(c['tot_coll_amt']) & _isna(c['collections_12_mths_ex_med']),
+     None),
+    ('coll_condition_2_3',
+     lambda c: (_isna(c['tot_coll_amt']) | (c['tot_coll_amt'] == 0))
+        & (_isna(c['collections_12_mths_ex_med'])
+           | (c['collections_12_mths_ex_med'] == 0)),
+     {'tot_coll_amt': 0, 'collections_12_mths_ex_med': 0}),
+    ('coll_condition_4',
+     lambda c: _isna(c['tot_coll_amt']) & (c['collections_12_mths_ex_med'] > 0),
+     None),
+    ('coll_condition_5',
+     lambda c: (c['tot_coll_amt'] == 0) & _isna(c['collections_12_mths_ex_med']),
+     None),
+    # open_il
+    ('open_il_condition_1',
+     lambda c: (_isna(c['open_il_12m']) | _isna(c['open_il_24m']))
+        & _isna(c['mths_since_rcnt_il']) & (c['total_bal_il'] == 0),
+     {'mths_since_rcnt_il': 300, 'open_il_12m': 0, 'open_il_24m': 0}),
+    ('open_il_condition_2',
+     lambda c: (_isna(c['open_il_12m']) | _isna(c['open_il_24m']))
+        & _isna(c['mths_since_rcnt_il']) & (c['total_bal_il'] > 0),
+     None),
+    ('open_il_condition_3',
+     lambda c: ((c['open_il_12m'] > 0) | (c['open_il_24m'] > 0))
+        & _isna(c['mths_since_rcnt_il']) & (c['total_bal_il'] > 0),
+     {'mths_since_rcnt_il': 1}),
+    ('open_il_condition_4',
+     lambda c: _isna(c['open_il_12m']) & _isna(c['open_il_24m'])
+        & _isna(c['mths_since_rcnt_il']) & _isna(c['total_bal_il']),
+     {'open_il_12m': 0, 'open_il_24m': 0, 'mths_since_rcnt_il': 300,
+      'total_bal_il': 0}),
+    # total_bal_il
+    ('bal_il_condition_1',
+     lambda c: (c['total_bal_il'] > 0) & _isna(c['il_util']),
+     None),
+    ('bal_il_condition_2',
+     lambda c: _isna(c['total_bal_il']) & (c['il_util'] > 0),
+     None),
+    ('bal_il_condition_3',
+     lambda c: _isna(c['total_bal_il']) & (c['il_util'] == 0),
+     {'total_bal_il': 0}),
+    ('bal_il_condition_4',
+     lambda c: (c['total_bal_il'] == 0) & _isna(c['il_util']),
+     {'il_util': 0}),
+    ('bal_il_condition_5',
+     lambda c: _isna(c['total_bal_il']) & _isna(c['il_util']),
+     {'total_bal_il': 0, 'il_util': 0}),
+    # revol_bal
+    ('revol_condition_1',
+     lambda c: (c['revol_bal'] > 0) & _isna(c['revol_util']),
+     None),
+    ('revol_condition_2',
+     lambda c: _isna(c['revol_bal']) & (c['revol_util'] > 0),
+     None),
+    ('revol_condition_3',
+     lambda c: _isna(c['revol_bal']) & (c['revol_util'] == 0),
+     {'revol_bal': 0}),
+    ('revol_condition_4',
+     lambda c: (c['revol_bal'] == 0) & _isna(c['revol_util']),
+     {'revol_util': 0}),
+    ('revol_condition_5',
+     lambda c: _isna(c['revol_bal']) & _isna(c['revol_util']),
+     {'revol_bal': 0, 'revol_util': 0}),
+    ]
+# observations missing any of these are dropped, absent columns are skipped
+MANDATORY_FEATURES = [
+    'annual_inc', 'dti', 'home_ownership',
+    'loan_amnt', 'term', 'int_rate', 'installment',
+    'grade', 'sub_grade', 'pymnt_plan'
+    ]
+# remaining missing values outside special conditions
+REPLACE_0_FEATURES = [
+    'il_util', 'total_cu_tl', 'inq_last_12m', 'all_util', 'open_rv_24m', 'open_rv_12m', 'open_acc_6m',
+    'total_bal_il', 'inq_fi', 'open_il_12m', 'open_il_24m', 'tot_coll_amt', 'tot_cur_bal', 'total_rev_hi_lim',
+    'revol_util', 'collections_12_mths_ex_med', 'pub_rec', 'acc_now_delinq', 'total_acc', 'open_acc', 'inq_last_6mths',
+    'delinq_2yrs', 'max_bal_bc'
+    ]
+REPLACE_300_FEATURES = [
+    'mths_since_rcnt_il', 'mths_since_last_record', 'mths_since_last_major_derog', 'mths_since_last_delinq',
+    ]
@@ -0,0 +1,353 @@
+import multiprocessing
+import os
+import time
+
+from optuna.samplers import TPESampler
+from optuna.study import MaxTrialsCallback
+from optuna.trial import TrialState
+import xgboost as xgb
+import optuna
+import pandas as pd
+import numpy as np
+
+
+def suggest_xgb_params(trial):
+    """Search space of the second (zooming) XGBoost study of the model notebook."""
+    return {
+        # learning parameter
+        'n_estimators': 400,
+        'early_stopping_rounds': 50,
+        'eval_metric': 'auc',
+        'learning_rate': trial.suggest_float('learning_rate', 0.01, 1, log=True),
+        'subsample': trial.suggest_float('subsample', 0.7, 0.8),
+        'max_delta_step': trial.suggest_float('max_delta_step', 4, 9),
+        'scale_pos_weight': trial.suggest_float('scale_post_weight', 1.5, 2.5),
+        # tree complexity
+        'max_depth': trial.suggest_int('max_depth', 3, 6),
+        'min_child_weight': trial.suggest_float('minimal_child_weight', 1, 10),
+        'alpha': trial.suggest_float('alpha', 4, 8),
+        'gamma': trial.suggest_float('gamma', 2, 5),
+        }
+
+
+def xgb_params_from_trial(params):
+    """XGBClassifier keyword arguments of a trial's `params` (e.g. `study.best_params`)."""
+    renamed = {'scale_post_weight': 'scale_pos_weight', 'minimal_child_weight': 'min_child_weight'}
+    return {renamed.get(name, name): value for name, value in params.items()}
+
+
+def make_storage(storage, heartbeat_interval=60):
+    """
+    Optuna storage of `storage`: database URLs (e.g. 'sqlite:///models/xgb.db')
+    get a storage whose running trials send a heartbeat every
+    `heartbeat_interval` seconds, trials of dead processes are failed and
+    retried. Any other path becomes an
+    append-only journal file, which is safe for several processes on one
+    machine but has no heartbeat.
+    """
+    if '://' in storage:
+        try:
+            retry = {'heartbeat_stale_trial_callback':
+                     optuna.storages.RetryHeartbeatStaleTrialCallback()}
+        except AttributeError: # optuna < 4.9
+            retry = {'failed_trial_callback': optuna.storages.RetryFailedTrialCallback()}
+        return optuna.storages.RDBStorage(
+            storage, heartbeat_interval=heartbeat_interval,
+            grace_period=2 * heartbeat_interval, **retry)
+    try:
+        from optuna.storages.journal import JournalFileBackend
+    except ImportError: # optuna < 4.0
+        from optuna.storages import JournalFileStorage as JournalFileBackend
+    return optuna.storages.JournalStorage(JournalFileBackend(storage))
+
+
+class XGBPruningCallback(xgb.callback.TrainingCallback):
+    """
+    Reports the per-round validation metric XGBoost already computes to the
+    trial, and stops boosting once the pruner decides the trial lags behind.
+    """
+    def __init__(self, trial, observation_key='validation_0-auc'):
+        self.trial = trial
+        self.observation_key = observation_key
+        self.best_iteration_ = None
+        self.best_score_ = None
+
+    def after_iteration(self, model, epoch, evals_log):
+        data_name, metric_name = self.observation_key.rsplit('-', 1)
+        score = evals_log[data_name][metric_name][-1]
+        if (self.best_score_ is None) or (score > self.best_score_):
+            self.best_iteration_, self.best_score_ = epoch, score
+        self.trial.report(score, step=epoch)
+        if self.trial.should_prune():
+            raise optuna.TrialPruned(f'trial was pruned at iteration {epoch}')
+        return False
+
+
+class XGBMatrixCache():
+    """
+    Training and validation set converted once to float32, C-contiguous
+    arrays and XGBoost QuantileDMatrix objects, so repeated trainings (tuning
+    trials, learning curves) skip the DataFrame conversion and the quantile
+    sketch and only pay for boosting.
+
+    Parameters
+    ----------
+    X_train, y_train, X_valid, y_valid: transformed training and validation set
+    max_bin: number of histogram bins, shared by every training on the cache
+    nthread: number of threads of the sketch and of every training, all
+        cores if None
+    """
+    def __init__(self, X_train, y_train, X_valid, y_valid, max_bin=256, nthread=None):
+        self.feature_names = [str(column) for column in X_train.columns]
+        self.max_bin = max_bin
+        self.nthread = nthread
+        self.X_train = np.ascontiguousarray(X_train.to_numpy(dtype='float32'))
+        self.X_valid = np.ascontiguousarray(X_valid.to_numpy(dtype='float32'))
+        self.y_train = np.asarray(y_train)
+        self.y_valid = np.asarray(y_valid)
+        self.dtrain = xgb.QuantileDMatrix(
+            self.X_train, self.y_train, feature_names=self.feature_names,
+            max_bin=max_bin, nthread=nthread)
+        self.dvalid = xgb.QuantileDMatrix(
+            self.X_valid, self.y_valid, feature_names=self.feature_names,
+            max_bin=max_bin, ref=self.dtrain, nthread=nthread)
+
+    def train(self, params, callbacks=None, evals_result=None, xgb_model=None,
+              eval_train=False):
+        """
+        Train a booster with XGBClassifier keyword arguments `params`.
+        The validation set is evaluated as `validation_0`, the same as the
+        first `eval_set` of XGBClassifier.fit, and the training set as `train`
+        if `eval_train`.
+        """
+        params = dict(params)
+        num_boost_round = params.pop('n_estimators', 100)
+        early_stopping_rounds = params.pop('early_stopping_rounds', None)
+        params.setdefault('objective', 'binary:logistic')
+        params.update(tree_method='hist', max_bin=self.max_bin)
+        if self.nthread is not None:
+            params.setdefault('nthread', self.nthread)
+        evals = [(self.dvalid, 'validation_0')]
+        if eval_train:
+            evals.insert(0, (self.dtrain, 'train'))
+        return xgb.train(
+            params, self.dtrain, num_boost_round=num_boost_round, evals=evals,
+            early_stopping_rounds=early_stopping_rounds, callbacks=callbacks,
+            evals_result=evals_result, xgb_model=xgb_model, verbose_eval=False)
+
+
+class XGBMetricCallback(xgb.callback.TrainingCallback):
+    """
+    Computes `metrics` (name -> callable(y_true, y_proba)) after every
+    boosting round from margins accumulated one tree at a time, so each round
+    only predicts its own trees instead of the whole ensemble.
+    """
+    def __init__(self, datasets, metrics):
+        self.datasets = datasets
+        self.metrics = metrics
+        self.margins_ = {name: None for name in datasets}
+        self.history_ = {name: {metric: [] for metric in metrics} for name in datasets}
+
+    def after_iteration(self, model, epoch, evals_log):
+        for name, (X, y) in self.datasets.items():
+            if self.margins_[name] is None:
+                # the first round carries the base score
+                margin = model.inplace_predict(
+                    X, iteration_range=(epoch, epoch + 1), predict_type='margin')
+            else:
+                margin = self.margins_[name] + model.inplace_predict(
+                    X, iteration_range=(epoch, epoch + 1), predict_type='margin',
+                    base_margin=np.zeros(len(X), dtype='float32'))
+            self.margins_[name] = margin
+            proba = 1 / (1 + np.exp(-margin.astype('float64')))
+            for metric, function in self.metrics.items():
+                self.history_[name][metric].append(function(y, proba))
+        return False
+
+
+def xgb_learning_curve(matrix_cache, params={}, num_rounds=100, metrics=None):
+    """
+    Per-round train and validation metrics of one XGBoost training run on
+    `matrix_cache` (XGBMatrixCache). `eval_metric` (AUC by default) comes
+    from the booster's evaluation log, extra `metrics`
+    (name -> callable(y_true, y_proba)) are computed incrementally.
+
+    Returns
+    -------
+    curve: DataFrame indexed by `steps` with `{set}-{metric}` columns,
+        `set` being `train` or `validation`
+    """
+    params = {'eval_metric': 'auc', **params, 'n_estimators': num_rounds}
+    evals_result = {}
+    callbacks = []
+    if metrics:
+        metric_callback = XGBMetricCallback({
+            'train': (matrix_cache.X_train, matrix_cache.y_train),
+            'validation_0': (matrix_cache.X_valid, matrix_cache.y_valid),
+            }, metrics)
+        callbacks.append(metric_callback)
+        evals_result_extra = metric_callback.history_
+    else:
+        evals_result_extra = {}
+    matrix_cache.train(
+        params, callbacks=callbacks, evals_result=evals_result, eval_train=True)
+    curve = {}
+    for log in [evals_result, evals_result_extra]:
+        for data_name, history in log.items():
+            set_name = 'validation' if data_name == 'validation_0' else data_name
+            for metric, values in history.items():
+                curve[f'{set_name}-{metric}'] = values
+    curve = pd.DataFrame(curve)
+    curve.index = pd.RangeIndex(1, len(curve) + 1, name='steps')
+    return curve
+
+
+def plot_xgb_learning_curve(curve, metric='auc', params={}, ax=None):
+    """Line plot of `metric` of the train and validation set of `xgb_learning_curve`."""
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    plot_df = curve[[f'train-{metric}', f'validation-{metric}']]
+    plot_df.columns = ['train', 'validation']
+    plot_df = pd.melt(
+        plot_df.reset_index(), id_vars=['steps'], value_vars=['train', 'validation'],
+        var_name='set', value_name=metric.upper())
+    if ax is None:
+        fig, ax = plt.subplots(figsize=(10, 6))
+    sns.lineplot(data=plot_df, x='steps', y=metric.upper(), hue='set', ax=ax)
+    ax.set_title(f'Booster Learning Steps,\nParameters = {str(params).strip("{}")}')
+    return ax
+
+
+class XGBTuningRunner():
+    """
+    Resumable, multi-process hyperparameter search of XGBClassifier.
+
+    Trials are stored in a file-based storage (see `make_storage`) instead of
+    pickling the study, so several worker processes can share one study and a
+    crashed search continues where it stopped. `best_iteration` and
+    `wall_time` are kept as trial user attributes (of pruned trials too), and
+    trials whose validation AUC lags behind the others at the same boosting
+    round are pruned. Each of `n_workers` worker processes trains with its
+    share of the cores.
+
+    Parameters
+    ----------
+    study_name: name of the study in the storage
+    storage: database URL or journal file path
+    X_train, y_train, X_valid, y_valid: transformed training and validation set
+    suggest_params: callable(trial) -> XGBClassifier keyword arguments
+    seed: seed of the TPE sampler, worker `i` uses `seed + i`
+    pruner: optuna pruner, MedianPruner by default
+    """
+    def __init__(self, study_name, storage, X_train, y_train, X_valid, y_valid,
+                 suggest_params=suggest_xgb_params, seed=99, pruner=None):
+        self.study_name = study_name
+        self.storage = storage
+        self.X_train = X_train
+        self.y_train = y_train
+        self.X_valid = X_valid
+        self.y_valid = y_valid
+        self.suggest_params = suggest_params
+        self.seed = seed
+        self.pruner = pruner
+        self._matrix_cache = None
+        self._nthread = None
+
+    def load_study(self, worker=0):
+        return optuna.create_study(
+            study_name=self.study_name, storage=make_storage(self.storage),
+            load_if_exists=True, direction='maximize',
+            sampler=TPESampler(seed=(None if self.seed is None else self.seed + worker)),
+            pruner=(self.pruner or optuna.pruners.MedianPruner(
+                n_startup_trials=5, n_warmup_steps=20)))
+
+    @property
+    def matrix_cache(self):
+        # built once per process, the DMatrix objects are not picklable
+        if self._matrix_cache is None:
+            self._matrix_cache = XGBMatrixCache(
+                self.X_train, self.y_train, self.X_valid, self.y_valid, nthread=self._nthread)
+        return self._matrix_cache
+
+    def __getstate__(self):
+        return {**self.__dict__, '_matrix_cache': None}
+
+    def objective(self, trial):
+        start = time.perf_counter()
+        evals_result = {}
+        pruning_callback = XGBPruningCallback(trial)
+        try:
+            booster = self.matrix_cache.train(
+                self.suggest_params(trial), callbacks=[pruning_callback],
+                evals_result=evals_result)
+        except optuna.TrialPruned:
+            trial.set_user_attr('best_iteration', int(pruning_callback.best_iteration_))
+            trial.set_user_attr('wall_time', time.perf_counter() - start)
+            raise
+        scores = evals_result['validation_0']['auc']
+        if booster.attr('best_iteration') is None:
+            best_iteration, best_score = len(scores) - 1, scores[-1]
+        else:
+            best_iteration, best_score = booster.best_iteration, booster.best_score
+        trial.set_user_attr('best_iteration', int(best_iteration))
+        trial.set_user_attr('wall_time', time.perf_counter() - start)
+        return best_score
+
+    def _fail_stale_trials(self, study):
+        # trials left running by a crashed search are failed and enqueued again
+        if '://' in self.storage:
+            # only those whose heartbeat stopped, retried by the storage callback
+            optuna.storages.fail_stale_trials(study)
+            return
+        # a journal has no heartbeat, every running trial is stale since no
+        # other search runs (see `optimize`)
+        for trial in study.get_trials(deepcopy=False, states=(TrialState.RUNNING,)):
+            study.tell(trial.number, state=TrialState.FAIL)
+            study.enqueue_trial(trial.params, skip_if_exists=True)
+
+    def _optimize(self, n_trials, worker=0, nthread=None):
+        if nthread != self._nthread:
+            self._nthread, self._matrix_cache = nthread, None
+        optuna.logging.set_verbosity(optuna.logging.WARNING)
+        study = self.load_study(worker)
+        study.optimize(
+            self.objective,
+            callbacks=[MaxTrialsCallback(
+                n_trials, states=(TrialState.COMPLETE, TrialState.PRUNED))])
+        return study
+
+    def optimize(self, n_trials, n_workers=1):
+        """
+        Run the search until the study holds `n_trials` finished trials.
+        With a journal file storage, must not be called while another search
+        on the same study is running.
+        """
+        study = self.load_study()
+        self._fail_stale_trials(study)
+        if n_workers == 1:
+            return self._optimize(n_trials)
+        # one xgboost thread pool per worker would oversubscribe the cores
+        nthread = max(1, os.cpu_count() // n_workers)
+        context = multiprocessing.get_context()
+        workers = [
+            context.Process(target=self._optimize, args=(n_trials, worker, nthread))
+            for worker in range(n_workers)
+            ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return self.load_study()
+
+
+def study_results(study):
+    """
+    `study.trials_dataframe()` of the finished trials with their XGBoost
+    iterations as `xgb_iters`, in place of scraping the optimization log.
+    """
+    results = study.trials_dataframe()
+    results = results[results.state.isin(['COMPLETE', 'PRUNED'])]
+    return results.rename(columns={
+        'user_attrs_best_iteration': 'xgb_iters',
+        'user_attrs_wall_time': 'wall_time'
+        }).reset_index(drop=True)
@@ -0,0 +1,143 @@
+import os
+
+from sklearn.compose import ColumnTransformer
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder
+import xgboost as xgb
+import pandas as pd
+import numpy as np
+
+
+def column_features(column_transformer: ColumnTransformer):
+    """
+    Input feature of every output column of a fitted ColumnTransformer, e.g.
+    'emp_length' for every `categorical__emp_length_*` column and 'annual_inc'
+    for `power__annual_inc`.
+    """
+    feature_names_in = list(column_transformer.feature_names_in_)
+    features = []
+    for name, transformer, columns in column_transformer.transformers_:
+        if transformer == 'drop':
+            continue
+        columns = [
+            feature_names_in[column] if isinstance(column, (int, np.integer)) else column
+            for column in columns
+            ]
+        if isinstance(transformer, OneHotEncoder):
+            if transformer.drop_idx_ is not None:
+                raise NotImplementedError('OneHotEncoder with `drop` is not supported')
+            for column, categories in zip(columns, transformer.categories_):
+                features += [column] * len(categories)
+        else:
+            # passthrough and one to one transformers (PowerTransformer)
+            features += columns
+    return features
+
+
+class ReasonCodeExplainer():
+    """
+    Per-loan reason codes of the final classifier from XGBoost's tree
+    contributions (`pred_contribs`, exact TreeSHAP unless `approximate`).
+
+    The contributions of the output columns of the feature pipeline are
+    summed back to the features going in (one-hot columns to their
+    categorical feature, power-transformed columns to their raw feature), so
+    the reasons name the LoanDataLabelPredictor features (and the sub grade
+    averages of LoanFeatureExtract). The reasons of a loan are its `top_k`
+    features pushing the most towards 'Bad Loan' (largest positive
+    contribution to the margin).
+
+    Rows are transformed and explained `chunksize` at a time, so the memory
+    is bounded by the chunk; each chunk is spread over `n_jobs` xgboost
+    threads.
+
+    Parameters
+    ----------
+    feature_pipeline: fitted Pipeline of LoanFeatureExtract and ColumnTransformer
+    classifier: fitted XGBClassifier
+    top_k: number of reason codes per loan
+    chunksize: number of rows explained at once
+    n_jobs: number of threads, `os.cpu_count()` if None
+    approximate: use the faster approximate contributions (`approx_contribs`,
+        Saabas), they still sum to the margin
+    """
+    def __init__(self, feature_pipeline: Pipeline, classifier, top_k=4, chunksize=100000,
+                 n_jobs=None, approximate=False):
+        self.feature_pipeline = feature_pipeline
+        self.approximate = approximate
+        self.top_k = top_k
+        self.chunksize = chunksize
+        self.n_jobs = n_jobs
+        features = column_features(feature_pipeline.steps[-1][1])
+        self.features_ = list(dict.fromkeys(features))
+        # (n_columns, n_features) 0/1 matrix summing the columns of a feature
+        self.grouping_ = np.zeros((len(features), len(self.features_)), dtype='float32')
+        self.grouping_[
+            np.arange(len(features)), [self.features_.index(f) for f in features]] = 1
+        self.booster_ = classifier.get_booster().copy()
+        self.booster_.set_param({'nthread': n_jobs or os.cpu_count()})
+        try:
+            self.iteration_range_ = (0, classifier.best_iteration + 1)
+        except AttributeError:
+            self.iteration_range_ = (0, 0)
+
+    def contributions(self, X_transformed):
+        """
+        Contributions of every feature to the margin, as a DataFrame with one
+        column per feature and the `bias`, their sum is the margin.
+        """
+        contribs = self.booster_.predict(
+            xgb.DMatrix(X_transformed, nthread=self.n_jobs or os.cpu_count()),
+            pred_contribs=True, approx_contribs=self.approximate,
+            iteration_range=self.iteration_range_, validate_features=False)
+        features = pd.DataFrame(
+            contribs[:, :-1] @ self.grouping_, columns=self.features_,
+            index=getattr(X_transformed, 'index', None))
+        features['bias'] = contribs[:, -1]
+        return features
+
+    def _reasons(self, contributions, index):
+        k = min(self.top_k, contributions.shape[1])
+        top = np.argpartition(-contributions, k - 1, axis=1)[:, :k]
+        top_values = np.take_along_axis(contributions, top, axis=1)
+        order = np.argsort(-top_values, axis=1, kind='stable')
+        top = np.take_along_axis(top, order, axis=1)
+        top_values = np.take_along_axis(top_values, order, axis=1)
+        categories = pd.CategoricalDtype(self.features_)
+        reasons = {}
+        for i in range(k):
+            reasons[f'reason_{i + 1}'] = pd.Categorical.from_codes(
+                top[:, i], dtype=categories)
+            reasons[f'contribution_{i + 1}'] = top_values[:, i]
+        return pd.DataFrame(reasons, index=index)
+
+    def _explain_chunk(self, X):
+        X_transformed = self.feature_pipeline.transform(X)
+        contributions = self.contributions(X_transformed)
+        margin = contributions.sum(axis=1).to_numpy()
+        reasons = self._reasons(contributions[self.features_].to_numpy(), X.index)
+        reasons.insert(0, 'proba_bad_loan', 1 / (1 + np.exp(-margin)))
+        return reasons
+
+    def explain_chunks(self, chunks):
+        """Yield the reasons of every predictor chunk, e.g. of LoanDataStream."""
+        for X in chunks:
+            if isinstance(X, tuple):
+                X = X[0]
+            yield self._explain_chunk(X)
+
+    def explain(self, X):
+        """
+        Reason codes of every row of X (predictor of the preprocessing
+        pipeline): `proba_bad_loan`, then `reason_i` (feature name) and
+        `contribution_i` (margin contribution) for i in 1..top_k.
+        """
+        if len(X) == 0:
+            reasons = self._reasons(
+                np.empty((0, len(self.features_)), dtype='float32'), X.index)
+            reasons.insert(0, 'proba_bad_loan', np.empty(0, dtype='float32'))
+            return reasons
+        return pd.concat(self.explain_chunks(
+            X.iloc[start:(start + self.chunksize)]
+            for start in range(0, len(X), self.chunksize)
+            ))
@@ -0,0 +1,168 @@
+import json
+import os
+
+from sklearn.metrics import roc_auc_score
+from sklearn.pipeline import Pipeline
+from xgboost import XGBClassifier
+import xgboost as xgb
+import pandas as pd
+import pyarrow as pa
+import numpy as np
+
+from modules.model_tuning import XGBMatrixCache
+
+
+class WarmStartRetrainer():
+    """
+    Monthly retraining of the final classifier by continuing boosting from
+    the saved booster instead of refitting it from scratch.
+
+    Each `update` transforms only the newly matured loans with the fitted
+    (never refitted) feature pipeline, appends them to the transformed
+    history kept as Arrow files in `model_dir`, and adds
+    `n_estimators_per_update` trees trained on them (`train_on='new'`) or on
+    the whole cached history (`train_on='history'`). Every
+    `full_retrain_every` updates a guard retrains from scratch on the cached
+    history with the original number of trees and compares the validation
+    AUC; if the warm-started booster falls more than `max_auc_drop` behind,
+    the full retrain replaces it. The outcome of every update is kept in
+    `state_['log']`.
+
+    Parameters
+    ----------
+    model_dir: directory of the booster, the transformed history and the state
+    feature_pipeline: fitted Pipeline of LoanFeatureExtract and ColumnTransformer
+    params: XGBClassifier keyword arguments of the final classifier, e.g.
+        `{'n_estimators': 334, **xgb_params_from_trial(study.best_params)}`
+    n_estimators_per_update: number of trees added by an update
+    train_on: 'new' or 'history', the loans the added trees are trained on
+    full_retrain_every: number of updates between two guard checks, None
+        never checks
+    max_auc_drop: AUC the warm-started booster may lose to a full retrain
+    """
+    def __init__(self, model_dir, feature_pipeline: Pipeline, params,
+                 n_estimators_per_update=20, train_on='new', full_retrain_every=6,
+                 max_auc_drop=0.002):
+        self.model_dir = model_dir
+        self.feature_pipeline = feature_pipeline
+        self.params = params
+        self.n_estimators_per_update = n_estimators_per_update
+        self.train_on = train_on
+        self.full_retrain_every = full_retrain_every
+        self.max_auc_drop = max_auc_drop
+        os.makedirs(os.path.join(model_dir, 'history'), exist_ok=True)
+        self.state_ = self._load_state()
+
+    def _path(self, *names):
+        return os.path.join(self.model_dir, *names)
+
+    def _load_state(self):
+        if os.path.exists(self._path('state.json')):
+            with open(self._path('state.json')) as f:
+                return json.load(f)
+        return {'updates': 0, 'parts': [], 'log': []}
+
+    def _save_state(self):
+        with open(self._path('state.json.tmp'), 'w') as f:
+            json.dump(self.state_, f, indent=1)
+        os.replace(self._path('state.json.tmp'), self._path('state.json'))
+
+    def _append_history(self, X_transformed, y):
+        name = f'part-{len(self.state_["parts"]):05d}.arrow'
+        table = pa.Table.from_pandas(
+            X_transformed.assign(loan_category=np.asarray(y)), preserve_index=False)
+        with pa.OSFile(self._path('history', name), 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        self.state_['parts'].append(name)
+
+    def load_history(self):
+        """Transformed history and labels, read from the memory-mapped parts."""
+        tables = []
+        for name in self.state_['parts']:
+            with pa.memory_map(self._path('history', name), 'r') as source:
+                tables.append(pa.ipc.open_file(source).read_all())
+        table = pa.concat_tables(tables)
+        label = table.column('loan_category').to_numpy()
+        return table.drop(['loan_category']).to_pandas(), label
+
+    def _save_booster(self, booster):
+        booster.save_model(self._path('booster.ubj.tmp'))
+        os.replace(self._path('booster.ubj.tmp'), self._path('booster.ubj'))
+
+    def load_booster(self):
+        booster = xgb.Booster()
+        booster.load_model(self._path('booster.ubj'))
+        return booster
+
+    def classifier(self):
+        """XGBClassifier of the current booster, e.g. for LoanScorer."""
+        classifier = XGBClassifier(**self.params)
+        classifier.load_model(self._path('booster.ubj'))
+        return classifier
+
+    def initialize(self, X_transformed, y, classifier: XGBClassifier = None):
+        """
+        Start from the transformed training set and the fitted final
+        classifier, trained here with `params` if None.
+        """
+        if classifier is None:
+            classifier = XGBClassifier(**self.params).fit(X_transformed, y, verbose=False)
+        self.state_ = {'updates': 0, 'parts': [], 'log': []}
+        self._append_history(X_transformed, y)
+        self._save_booster(classifier.get_booster())
+        self._save_state()
+        return self
+
+    def _full_retrain(self, X_valid, y_valid):
+        X_history, y_history = self.load_history()
+        matrix_cache = XGBMatrixCache(X_history, y_history, X_valid, y_valid)
+        # the validation set scores the retrained model against the updated
+        # one, early stopping on it would favour the retrained model
+        return matrix_cache.train({**self.params, 'early_stopping_rounds': None})
+
+    def update(self, X_new, y_new, X_valid, y_valid):
+        """
+        Fold newly matured loans (output of the preprocessing pipeline) into
+        the model. The validation set is scored for the log and the guard.
+        """
+        X_new = self.feature_pipeline.transform(X_new)
+        X_valid = self.feature_pipeline.transform(X_valid)
+        self._append_history(X_new, y_new)
+        if self.train_on == 'history':
+            X_train, y_train = self.load_history()
+        elif self.train_on == 'new':
+            X_train, y_train = X_new, y_new
+        else:
+            raise ValueError(f'unknown train_on {self.train_on}')
+        matrix_cache = XGBMatrixCache(X_train, y_train, X_valid, y_valid)
+        params = {
+            **self.params, 'n_estimators': self.n_estimators_per_update,
+            'early_stopping_rounds': None,
+            }
+        booster = matrix_cache.train(params, xgb_model=self.load_booster())
+        # every tree counts, a best iteration of the initial fit must not cut them
+        booster.set_attr(best_iteration=None, best_score=None)
+        valid_auc = roc_auc_score(
+            y_valid, booster.inplace_predict(matrix_cache.X_valid, validate_features=False))
+        self.state_['updates'] += 1
+        entry = {
+            'update': self.state_['updates'], 'n_new': len(X_new),
+            'n_trees': booster.num_boosted_rounds(), 'valid_auc': valid_auc,
+            }
+        if self.full_retrain_every \
+                and (self.state_['updates'] % self.full_retrain_every == 0):
+            full_booster = self._full_retrain(X_valid, y_valid)
+            full_auc = roc_auc_score(
+                y_valid, full_booster.inplace_predict(matrix_cache.X_valid, validate_features=False))
+            entry['full_retrain_auc'] = full_auc
+            if valid_auc < full_auc - self.max_auc_drop:
+                booster = full_booster
+                entry['replaced'] = True
+        self._save_booster(booster)
+        self.state_['log'].append(entry)
+        self._save_state()
+        return self
+
+    def report(self):
+        return pd.DataFrame(self.state_['log']).set_index('update')
@@ -0,0 +1,142 @@
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, PowerTransformer
+import numpy as np
+
+from modules.data_preprocess import (
+    LoanDataPreprocess, LoanDataLabelPredictor, LoanDataMissingHandler,
+    MISSING_RULES, MANDATORY_FEATURES, REPLACE_0_FEATURES, REPLACE_300_FEATURES
+    )
+from modules.feature_extract import LoanFeatureExtract
+from modules.scoring_runtime import ScorerRuntime, save_artifact, _category_key
+
+def _step(pipeline, step_type):
+    return next(step for _, step in pipeline.steps if isinstance(step, step_type))
+
+
+class LoanScorer(ScorerRuntime):
+    """
+    Scores one loan application at a time without building a DataFrame.
+
+    The fitted preprocessing pipeline, feature pipeline
+    (LoanFeatureExtract + ColumnTransformer of OneHotEncoder, PowerTransformer
+    and passthrough columns) and classifier are compiled at construction into
+    plain lookups: feature casts, the MISSING_RULES of LoanDataMissingHandler,
+    sub grade statistics, one-hot offsets and Yeo-Johnson lambdas. Each call
+    fills a preallocated float32 row and runs the booster on it in place.
+
+    Applications the batch path would drop (e.g. a mandatory feature is
+    missing) or reject (an unknown category of a OneHotEncoder with
+    `handle_unknown='error'`) raise ValueError. A scorer is not thread safe, since the feature
+    buffer is shared between calls.
+
+    Parameters
+    ----------
+    preprocess_pipeline: fitted Pipeline of LoanDataPreprocess,
+        LoanDataLabelPredictor and LoanDataMissingHandler
+    feature_pipeline: fitted Pipeline of LoanFeatureExtract and ColumnTransformer
+    classifier: fitted XGBClassifier
+    """
+    def __init__(self, preprocess_pipeline: Pipeline, feature_pipeline: Pipeline,
+                 classifier):
+        preprocess = _step(preprocess_pipeline, LoanDataPreprocess)
+        label_predictor = _step(preprocess_pipeline, LoanDataLabelPredictor)
+        missing_handler = _step(preprocess_pipeline, LoanDataMissingHandler)
+        feature_extract = _step(feature_pipeline, LoanFeatureExtract)
+        column_transformer = feature_pipeline.steps[-1][1]
+        # preprocess + label predictor
+        self.features_ = label_predictor._selected_features()
+        self.float_features_ = set(preprocess.float_features_) & set(self.features_)
+        self.emp_length_replace_ = preprocess.emp_length_replace_
+        self.emp_length_order_ = set(preprocess.emp_length_order_)
+        # missing handler, falsy replace values are skipped as in transform
+        self.missing_rules_ = [
+            (name, condition, None if replace is None else [
+                (feature, missing_handler._replace_value(value))
+                for feature, value in replace.items()
+                if missing_handler._replace_value(value)
+                ])
+            for name, condition, replace in MISSING_RULES
+            ]
+        self.mandatory_features_ = [
+            feature for feature in MANDATORY_FEATURES if feature in self.features_]
+        self.fill_values_ = [
+            (feature, value)
+            for features, value in [(REPLACE_0_FEATURES, 0), (REPLACE_300_FEATURES, 300)]
+            for feature in features if feature in self.features_
+            ]
+        # feature extract
+        recovery = feature_extract.avg_defaulted_recovery_
+        portion = feature_extract.portion_defaulted_
+        self.sub_grade_features_ = {
+            'avg_defaulted_recovery': dict(zip(
+                recovery.sub_grade, recovery.avg_defaulted_recovery.astype('float64'))),
+            'avg_portion_defaulted': dict(zip(
+                portion.sub_grade, portion.avg_portion_defaulted.astype('float64'))),
+            }
+        # column transformer, every output column gets a position in the buffer
+        feature_names_in = list(column_transformer.feature_names_in_)
+        self.one_hot_ = []
+        self.power_ = []
+        self.passthrough_ = []
+        position = 0
+        for name, transformer, columns in column_transformer.transformers_:
+            if transformer == 'drop':
+                continue
+            columns = [
+                feature_names_in[column] if isinstance(column, (int, np.integer)) else column
+                for column in columns
+                ]
+            if transformer == 'passthrough':
+                for column in columns:
+                    self.passthrough_.append((column, position))
+                    position += 1
+            elif isinstance(transformer, OneHotEncoder):
+                if transformer.drop_idx_ is not None:
+                    raise NotImplementedError('OneHotEncoder with `drop` is not supported')
+                if (transformer.max_categories is not None) \
+                        or (transformer.min_frequency is not None):
+                    raise NotImplementedError(
+                        'OneHotEncoder with infrequent categories is not supported')
+                # unknown categories raise as in the batch path, else all zero
+                unknown_error = transformer.handle_unknown == 'error'
+                for column, categories in zip(columns, transformer.categories_):
+                    offsets = {
+                        _category_key(category): position + offset
+                        for offset, category in enumerate(categories)
+                        }
+                    self.one_hot_.append(
+                        (column, offsets, position, len(categories), unknown_error))
+                    position += len(categories)
+            elif isinstance(transformer, PowerTransformer):
+                if transformer.method != 'yeo-johnson':
+                    raise NotImplementedError('only yeo-johnson PowerTransformer is supported')
+                mean, scale = [0.] * len(columns), [1.] * len(columns)
+                if transformer.standardize:
+                    mean = transformer._scaler.mean_
+                    scale = transformer._scaler.scale_
+                for column, lmbda, mean_, scale_ in zip(
+                        columns, transformer.lambdas_, mean, scale):
+                    self.power_.append(
+                        (column, float(lmbda), float(mean_), float(scale_), position))
+                    position += 1
+            else:
+                raise NotImplementedError(
+                    f'{transformer.__class__.__name__} can not be compiled')
+        self.buffer_ = np.zeros((1, position), dtype='float32')
+        # classifier
+        self.booster_ = classifier.get_booster()
+        try:
+            self.iteration_range_ = (0, classifier.best_iteration + 1)
+        except AttributeError:
+            self.iteration_range_ = (0, 0)
+
+    def _predict(self, matrix):
+        return self.booster_.inplace_predict(
+            matrix, iteration_range=self.iteration_range_, validate_features=False)
+
+    def save(self, path):
+        """
+        Write the scorer as an artifact directory, loaded without pandas,
+        scikit-learn or xgboost by `modules.scoring_runtime.load_scorer`.
+        """
+        return save_artifact(self, path)
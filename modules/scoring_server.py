@@ -0,0 +1,179 @@
+import asyncio
+import time
+
+import numpy as np
+
+from modules.scoring_runtime import ScorerRuntime
+
+
+class LatencyHistogram():
+    """
+    Fixed, log-spaced latency buckets from 1 microsecond to `max_seconds`.
+    Recording a value is O(1) and the memory does not grow with the traffic.
+    """
+    def __init__(self, max_seconds=10., buckets_per_decade=10):
+        self.edges_ = np.logspace(
+            -6, np.log10(max_seconds), int(np.log10(max_seconds * 1e6) * buckets_per_decade) + 1)
+        self.counts_ = np.zeros(len(self.edges_) + 1, dtype='int64')
+        self.total_ = 0.
+
+    def record(self, seconds):
+        self.counts_[np.searchsorted(self.edges_, seconds)] += 1
+        self.total_ += seconds
+
+    def quantile(self, q):
+        """Upper bucket edge below which a `q` share of the latencies fall."""
+        count = self.counts_.sum()
+        if count == 0:
+            return np.nan
+        bucket = np.searchsorted(np.cumsum(self.counts_), q * count)
+        return self.edges_[min(bucket, len(self.edges_) - 1)]
+
+    def summary(self):
+        count = int(self.counts_.sum())
+        return {
+            'count': count,
+            'mean': (self.total_ / count) if count else np.nan,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99),
+            }
+
+
+class MicroBatchScoringServer():
+    """
+    Local asyncio scoring service on top of a LoanScorer (or of the
+    ArtifactScorer of its saved artifact, see modules.scoring_runtime).
+
+    Concurrent `score` calls are queued and collected into micro-batches of
+    up to `max_batch_size` requests, or whatever arrived within `max_delay`
+    seconds of the first one. Each batch is transformed into one feature
+    matrix, record by record (see `ScorerRuntime.transform_many`, the
+    transform is most of the batch time), and scored with one booster call
+    in a worker thread, and the probabilities are fanned back out to the
+    callers. A record that can not be scored only fails its own request.
+
+    The queue holds at most `max_queue_size` requests: `score` waits for room
+    (backpressure), `score_nowait` raises asyncio.QueueFull instead (load
+    shedding). Latencies of the `queue`, `transform`, `monitor`, `predict`
+    and `total` stages are kept in `histograms_`.
+
+    Parameters
+    ----------
+    scorer: LoanScorer compiled from the fitted pipelines and classifier, or
+        ArtifactScorer
+    max_batch_size: maximum number of requests scored together
+    max_delay: seconds a batch waits for more requests after the first one
+    max_queue_size: maximum number of queued requests
+    monitor: fitted DriftMonitor (modules.drift) updated with the predictor
+        values of every batch, its cost is kept in the `monitor` histogram
+    """
+    stages = ('queue', 'transform', 'monitor', 'predict', 'total')
+
+    def __init__(self, scorer: ScorerRuntime, max_batch_size=512, max_delay=0.005,
+                 max_queue_size=10000, monitor=None):
+        self.scorer = scorer
+        self.monitor = monitor
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.max_queue_size = max_queue_size
+        self.histograms_ = {stage: LatencyHistogram() for stage in self.stages}
+        self._queue = None
+        self._worker = None
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._worker = asyncio.create_task(self._serve())
+        return self
+
+    async def stop(self):
+        # score what is already queued, then stop the worker
+        if self._worker is None:
+            return
+        await self._queue.join()
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    def _request(self, record):
+        return record, asyncio.get_running_loop().create_future(), time.perf_counter()
+
+    async def score(self, record):
+        """Probability of `record` being a bad loan, waits if the queue is full."""
+        request = self._request(record)
+        await self._queue.put(request)
+        return await request[1]
+
+    async def score_nowait(self, record):
+        """Same as `score`, but raises asyncio.QueueFull if the queue is full."""
+        request = self._request(record)
+        self._queue.put_nowait(request)
+        return await request[1]
+
+    async def _next_batch(self):
+        batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self.max_delay
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def _score_batch(self, records):
+        start = time.perf_counter()
+        values = None if self.monitor is None else []
+        matrix, errors = self.scorer.transform_many(records, values)
+        transformed = time.perf_counter()
+        self.histograms_['transform'].record(transformed - start)
+        if self.monitor is not None:
+            self.monitor.update_records(values)
+            monitored = time.perf_counter()
+            self.histograms_['monitor'].record(monitored - transformed)
+            transformed = monitored
+        probas = self.scorer._predict(matrix)
+        self.histograms_['predict'].record(time.perf_counter() - transformed)
+        return probas, errors
+
+    async def _serve(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            started = time.perf_counter()
+            for _, _, enqueued in batch:
+                self.histograms_['queue'].record(started - enqueued)
+            try:
+                # the scorer is not thread safe, batches are scored one at a time
+                probas, errors = await loop.run_in_executor(
+                    None, self._score_batch, [record for record, _, _ in batch])
+            except Exception as error:
+                probas, errors = None, [error] * len(batch)
+            finished = time.perf_counter()
+            for i, (_, future, enqueued) in enumerate(batch):
+                self.histograms_['total'].record(finished - enqueued)
+                if future.cancelled():
+                    pass
+                elif errors[i] is not None:
+                    future.set_exception(errors[i])
+                else:
+                    future.set_result(float(probas[i]))
+                self._queue.task_done()
+
+    def report(self):
+        """Latency summary (seconds) of every stage."""
+        return {stage: histogram.summary() for stage, histogram in self.histograms_.items()}
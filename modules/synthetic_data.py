@@ -0,0 +1,220 @@
+import calendar
+
+import pandas as pd
+import numpy as np
+
+from modules.data_preprocess import LoanDataPreprocess
+
+GRADES = list('ABCDEFG')
+SUB_GRADES = [f'{grade}{level}' for grade in GRADES for level in range(1, 6)]
+EMP_LENGTHS = [
+    '< 1 year', '1 year', '2 years', '3 years', '4 years', '5 years',
+    '6 years', '7 years', '8 years', '9 years', '10+ years', 'n/a'
+    ]
+LOAN_STATUSES = {
+    'Fully Paid': 0.45, 'Charged Off': 0.10, 'Current': 0.36,
+    'Late (31-120 days)': 0.015, 'In Grace Period': 0.008,
+    'Late (16-30 days)': 0.004, 'Default': 0.001, 'Issued': 0.05,
+    'Does not meet the credit policy. Status:Fully Paid': 0.0092,
+    'Does not meet the credit policy. Status:Charged Off': 0.0028,
+    }
+PURPOSES = [
+    'debt_consolidation', 'credit_card', 'home_improvement', 'other',
+    'major_purchase', 'small_business', 'car', 'medical', 'moving',
+    'vacation', 'house', 'wedding', 'renewable_energy', 'educational'
+    ]
+STATES = [
+    'CA', 'NY', 'TX', 'FL', 'IL', 'NJ', 'PA', 'OH', 'GA', 'VA', 'NC', 'MI',
+    'MD', 'MA', 'AZ', 'WA', 'CO', 'MN', 'MO', 'IN', 'CT', 'TN', 'NV', 'WI'
+    ]
+EMP_TITLES = [
+    'Teacher', 'Manager', 'Registered Nurse', 'Owner', 'Supervisor',
+    'Sales', 'Project Manager', 'Driver', 'Office Manager', 'General Manager',
+    'Director', 'Engineer', 'Accountant', 'Police Officer', 'Analyst'
+    ]
+INT_COLUMNS = ['id', 'member_id', 'loan_amnt', 'funded_amnt', 'revol_bal', 'policy_code']
+# features only reported for loans issued from late 2015 on
+RECENT_FEATURES = [
+    'open_acc_6m', 'open_il_12m', 'open_il_24m', 'mths_since_rcnt_il',
+    'total_bal_il', 'il_util', 'open_rv_12m', 'open_rv_24m', 'max_bal_bc',
+    'all_util', 'inq_fi', 'total_cu_tl', 'inq_last_12m'
+    ]
+_preprocess = LoanDataPreprocess().fit()
+_CSV_COLUMNS = list(dict.fromkeys(
+    _preprocess.float_features_ + [
+        'term', 'grade', 'sub_grade', 'emp_title', 'emp_length', 'home_ownership',
+        'verification_status', 'issue_d', 'loan_status', 'pymnt_plan', 'desc',
+        'purpose', 'title', 'zip_code', 'addr_state', 'earliest_cr_line',
+        'initial_list_status', 'last_pymnt_d', 'next_pymnt_d', 'last_credit_pull_d',
+        'application_type', 'verification_status_joint'
+        ]))
+
+def _month_years(first_year, last_year):
+    """'%b-%Y' strings of every month from `first_year` to `last_year`."""
+    return np.array([
+        f'{calendar.month_abbr[month]}-{year}'
+        for year in range(first_year, last_year + 1) for month in range(1, 13)
+        ], dtype=object)
+
+def _with_nans(rng, values, share):
+    values = values.astype('float64')
+    values[rng.random(len(values)) < share] = np.nan
+    return values
+
+def _strings_with_nans(rng, values, share):
+    values = values.astype(object)
+    values[rng.random(len(values)) < share] = np.nan
+    return values
+
+def make_loans(n_rows, seed=None, first_year=2010, last_year=2015, start_id=0):
+    """
+    Synthetic LendingClub loans with the raw columns, csv dtypes, category
+    sets, '%b-%Y' date strings and missingness patterns of the csv files the
+    preprocessing pipeline reads (as `pd.read_csv` returns them).
+
+    Parameters
+    ----------
+    n_rows: number of loans
+    seed: seed of the random generator
+    first_year, last_year: range of `issue_d`
+    start_id: first `id`, to generate consecutive chunks of one file
+    """
+    rng = np.random.default_rng(seed)
+    n = n_rows
+    X = {}
+    X['id'] = np.arange(start_id, start_id + n, dtype='int64') + 1000000
+    X['member_id'] = X['id'] + 200000
+    # loan
+    loan_amnt = rng.integers(40, 1401, n) * 25.
+    term = np.where(rng.random(n) < 0.7, 36, 60)
+    sub_grade_idx = np.clip(rng.normal(9, 6, n).round().astype(int), 0, 34)
+    int_rate = (5.3 + sub_grade_idx * 0.62 + rng.normal(0, 0.3, n)).round(2)
+    monthly_rate = int_rate / 1200
+    installment = (loan_amnt * monthly_rate / (1 - (1 + monthly_rate) ** -term)).round(2)
+    X['loan_amnt'] = loan_amnt
+    X['funded_amnt'] = loan_amnt
+    X['funded_amnt_inv'] = (loan_amnt - rng.choice([0, 25, 50], n, p=[0.9, 0.05, 0.05])).round(2)
+    X['term'] = np.where(term == 36, ' 36 months', ' 60 months').astype(object)
+    X['int_rate'] = int_rate
+    X['installment'] = installment
+    X['grade'] = np.array(GRADES, dtype=object)[sub_grade_idx // 5]
+    X['sub_grade'] = np.array(SUB_GRADES, dtype=object)[sub_grade_idx]
+    # applicant
+    X['emp_title'] = _strings_with_nans(
+        rng, np.char.add(np.array(EMP_TITLES)[rng.integers(0, len(EMP_TITLES), n)],
+                         np.where(rng.random(n) < 0.1, ' ', '')), 0.06)
+    X['emp_length'] = _strings_with_nans(
+        rng, np.array(EMP_LENGTHS, dtype=object)[rng.integers(0, len(EMP_LENGTHS), n)], 0.01)
+    X['home_ownership'] = rng.choice(
+        np.array(['MORTGAGE', 'RENT', 'OWN', 'OTHER', 'NONE', 'ANY'], dtype=object), n,
+        p=[0.49, 0.40, 0.1097, 0.0002, 0.0001, 0.0000])
+    annual_inc = np.exp(rng.normal(11.05, 0.5, n)).round(-2)
+    X['annual_inc'] = _with_nans(rng, annual_inc, 0.00001)
+    X['verification_status'] = rng.choice(
+        np.array(['Verified', 'Source Verified', 'Not Verified'], dtype=object), n,
+        p=[0.33, 0.37, 0.30])
+    month_years = _month_years(first_year, last_year)
+    issue_idx = rng.integers(0, len(month_years), n)
+    X['issue_d'] = month_years[issue_idx]
+    status_names = np.array(list(LOAN_STATUSES), dtype=object)
+    status_p = np.array(list(LOAN_STATUSES.values()))
+    X['loan_status'] = rng.choice(status_names, n, p=status_p / status_p.sum())
+    X['pymnt_plan'] = np.where(rng.random(n) < 0.99998, 'n', 'y').astype(object)
+    X['desc'] = _strings_with_nans(
+        rng, np.char.add('  Borrower added on loan: ', rng.integers(0, 10**6, n).astype(str)), 0.85)
+    X['purpose'] = np.array(PURPOSES, dtype=object)[
+        np.minimum(rng.geometric(0.45, n) - 1, len(PURPOSES) - 1)]
+    X['title'] = _strings_with_nans(rng, X['purpose'].copy(), 0.0002)
+    X['zip_code'] = np.char.add(rng.integers(10, 999, n).astype(str).astype('<U3'), 'xx').astype(object)
+    X['addr_state'] = np.array(STATES, dtype=object)[rng.integers(0, len(STATES), n)]
+    X['dti'] = _with_nans(rng, rng.gamma(4, 4.5, n).clip(0, 39.99).round(2), 0.00001)
+    delinq_2yrs = rng.poisson(0.3, n).astype('float64')
+    X['delinq_2yrs'] = _with_nans(rng, delinq_2yrs, 0.0001)
+    X['earliest_cr_line'] = _strings_with_nans(
+        rng, _month_years(1960, first_year)[rng.integers(0, (first_year - 1960) * 12, n)], 0.0001)
+    X['inq_last_6mths'] = _with_nans(rng, rng.poisson(0.7, n), 0.0001)
+    # months since a delinquency are mostly reported for delinquent applicants
+    mths_since_last_delinq = rng.integers(0, 150, n).astype('float64')
+    mths_since_last_delinq[(delinq_2yrs == 0) & (rng.random(n) < 0.7)] = np.nan
+    X['mths_since_last_delinq'] = mths_since_last_delinq
+    pub_rec = np.where(rng.random(n) < 0.85, 0., rng.integers(1, 5, n)).astype('float64')
+    mths_since_last_record = rng.integers(0, 130, n).astype('float64')
+    mths_since_last_record[(pub_rec == 0) & (rng.random(n) < 0.97)] = np.nan
+    X['mths_since_last_record'] = mths_since_last_record
+    open_acc = rng.integers(1, 40, n).astype('float64')
+    X['open_acc'] = _with_nans(rng, open_acc, 0.0001)
+    X['pub_rec'] = _with_nans(rng, pub_rec, 0.0001)
+    X['revol_bal'] = (rng.gamma(1.5, 11000, n)).round()
+    X['revol_util'] = _with_nans(rng, rng.uniform(0, 100, n).round(1), 0.0006)
+    X['total_acc'] = _with_nans(rng, open_acc + rng.integers(0, 30, n), 0.0001)
+    X['initial_list_status'] = np.where(rng.random(n) < 0.5, 'f', 'w').astype(object)
+    # payments, according to the loan status
+    status = X['loan_status']
+    paid_off = np.isin(status, ['Fully Paid', 'Does not meet the credit policy. Status:Fully Paid'])
+    charged_off = np.isin(status, ['Charged Off', 'Default', 'Does not meet the credit policy. Status:Charged Off'])
+    issued = status == 'Issued'
+    portion_paid = np.where(paid_off, 1., np.where(issued, 0., rng.uniform(0, 1, n)))
+    total_rec_prncp = (loan_amnt * portion_paid).round(2)
+    total_rec_int = (installment * term * portion_paid - total_rec_prncp).clip(0).round(2)
+    total_rec_late_fee = np.where(rng.random(n) < 0.02, rng.uniform(0, 60, n), 0.).round(2)
+    recoveries = np.where(charged_off, (loan_amnt - total_rec_prncp) * rng.uniform(0, 0.2, n), 0.).round(2)
+    out_prncp = np.where(paid_off | charged_off, 0., loan_amnt - total_rec_prncp).round(2)
+    total_pymnt = (total_rec_prncp + total_rec_int + total_rec_late_fee + recoveries).round(2)
+    X['out_prncp'] = out_prncp
+    X['out_prncp_inv'] = out_prncp
+    X['total_pymnt'] = total_pymnt
+    X['total_pymnt_inv'] = total_pymnt
+    X['total_rec_prncp'] = total_rec_prncp
+    X['total_rec_int'] = total_rec_int
+    X['total_rec_late_fee'] = total_rec_late_fee
+    X['recoveries'] = recoveries
+    X['collection_recovery_fee'] = (recoveries * 0.18).round(2)
+    last_pymnt_idx = np.minimum(issue_idx + rng.integers(1, 60, n), len(month_years) - 1)
+    X['last_pymnt_d'] = np.where(issued, np.nan, month_years[last_pymnt_idx]).astype(object)
+    X['last_pymnt_amnt'] = np.where(issued, 0., installment).round(2)
+    X['next_pymnt_d'] = np.where(
+        paid_off | charged_off, np.nan, month_years[np.minimum(last_pymnt_idx + 1, len(month_years) - 1)]
+        ).astype(object)
+    X['last_credit_pull_d'] = _strings_with_nans(
+        rng, month_years[rng.integers(issue_idx, len(month_years))], 0.00005)
+    X['collections_12_mths_ex_med'] = _with_nans(
+        rng, (rng.random(n) < 0.01).astype('float64'), 0.0002)
+    mths_since_last_major_derog = rng.integers(0, 160, n).astype('float64')
+    mths_since_last_major_derog[rng.random(n) < 0.75] = np.nan
+    X['mths_since_last_major_derog'] = mths_since_last_major_derog
+    X['policy_code'] = np.ones(n)
+    application_type = np.where(rng.random(n) < 0.9995, 'INDIVIDUAL', 'JOINT').astype(object)
+    X['application_type'] = application_type
+    joint = application_type == 'JOINT'
+    X['annual_inc_joint'] = np.where(joint, annual_inc * 1.8, np.nan).round(-2)
+    X['dti_joint'] = np.where(joint, X['dti'] * 0.8, np.nan).round(2)
+    X['verification_status_joint'] = np.where(joint, 'Not Verified', None)
+    X['acc_now_delinq'] = _with_nans(rng, (rng.random(n) < 0.005).astype('float64'), 0.0001)
+    # account totals are missing for loans issued before 2012
+    old_loan = issue_idx < (2012 - first_year) * 12
+    for feature, values in [
+            ('tot_coll_amt', np.where(rng.random(n) < 0.86, 0., rng.gamma(1, 500, n)).round()),
+            ('tot_cur_bal', rng.gamma(1.2, 115000, n).round()),
+            ('total_rev_hi_lim', rng.gamma(2, 15000, n).round())]:
+        X[feature] = np.where(old_loan, np.nan, values)
+    recent = (month_years[issue_idx] == f'Dec-{last_year}') & (rng.random(n) < 0.5)
+    for feature in RECENT_FEATURES:
+        X[feature] = np.where(recent, rng.integers(0, 20, n), np.nan).astype('float64')
+    X['il_util'] = np.where(recent, rng.uniform(0, 150, n).round(1), np.nan)
+    X['all_util'] = np.where(recent, rng.uniform(0, 150, n).round(1), np.nan)
+    for feature in ['total_bal_il', 'max_bal_bc']:
+        X[feature] = np.where(recent, rng.gamma(1, 10000, n).round(), np.nan)
+    # whole numbers never missing are parsed as int64, whatever the sample
+    frame = pd.DataFrame(X)
+    for feature in INT_COLUMNS:
+        frame[feature] = frame[feature].astype('int64')
+    return frame[_CSV_COLUMNS]
+
+def write_loan_csv(filepath, n_rows, seed=None, chunksize=1000000, **kwargs):
+    """Write `n_rows` synthetic loans to a csv file, `chunksize` rows at a time."""
+    rng = np.random.default_rng(seed)
+    for start in range(0, n_rows, chunksize):
+        chunk = make_loans(
+            min(chunksize, n_rows - start), seed=rng.integers(2**32), start_id=start, **kwargs)
+        chunk.to_csv(filepath, mode=('w' if start == 0 else 'a'), header=(start == 0), index=False)
+    return filepath
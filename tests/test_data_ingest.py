@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules.benchmark import make_preprocess_pipeline
+from modules.data_ingest import read_loan_csv, pipeline_pushdown
+from modules.synthetic_data import make_loans
+
+
+@pytest.fixture(scope='module')
+def loan_csv(tmp_path_factory):
+    raw = make_loans(3000, 0)
+    # quoted fields spanning several lines
+    raw.loc[raw.index[::7], 'desc'] = 'line one\nline "two", three'
+    path = tmp_path_factory.mktemp('data') / 'loans.csv'
+    raw.to_csv(path, index=False)
+    return path
+
+
+@pytest.fixture(scope='module')
+def full_read(loan_csv):
+    pipeline = make_preprocess_pipeline()
+    X = read_loan_csv(loan_csv, preprocess=pipeline_pushdown(pipeline)['preprocess'])
+    return pipeline.fit_transform(X)
+
+
+def assert_transform_equal(result, expected, **kws):
+    pd.testing.assert_frame_equal(result[0], expected[0], **kws)
+    np.testing.assert_array_equal(result[1], expected[1])
+
+
+def test_full_read_equals_plain_read(loan_csv, full_read):
+    # the in-place `.loc` casts of LoanDataPreprocess keep the dtypes of a
+    # plain read, only the values are the same
+    plain_read = make_preprocess_pipeline().fit_transform(pd.read_csv(loan_csv))
+    assert_transform_equal(full_read, plain_read, check_dtype=False, check_categorical=False)
+
+
+def test_pushdown_equals_full_read(loan_csv, full_read):
+    pipeline = make_preprocess_pipeline()
+    X = read_loan_csv(loan_csv, **pipeline_pushdown(pipeline))
+    assert len(X) < 3000
+    assert_transform_equal(pipeline.fit_transform(X), full_read)
+
+
+@pytest.mark.parametrize('chunksize', [700, 3000])
+def test_pushdown_chunks_equal_full_read(loan_csv, full_read, chunksize):
+    pipeline = make_preprocess_pipeline()
+    pushdown = pipeline_pushdown(pipeline)
+    # every chunk has the categories of its own rows, as an unfiltered
+    # chunked read
+    dtypes = read_loan_csv(
+        loan_csv, preprocess=pushdown['preprocess'], usecols=pushdown['usecols']).dtypes
+    chunks = [
+        chunk.astype({
+            feature: dtypes[feature] for feature in chunk.columns
+            if isinstance(dtypes[feature], pd.CategoricalDtype)
+            })
+        for chunk in read_loan_csv(loan_csv, **pushdown, chunksize=chunksize)
+        ]
+    assert len(chunks) == -(-3000 // chunksize)
+    X = pd.concat(chunks)
+    pd.testing.assert_index_equal(X.index, pd.RangeIndex(len(X)))
+    assert_transform_equal(pipeline.fit_transform(X), full_read)
+
+
+def test_pushdown_from_buffer(loan_csv, full_read):
+    pipeline = make_preprocess_pipeline()
+    with open(loan_csv) as f:
+        X = read_loan_csv(f, **pipeline_pushdown(pipeline))
+    assert_transform_equal(pipeline.fit_transform(X), full_read)
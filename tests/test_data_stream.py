@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules.benchmark import make_preprocess_pipeline
+from modules.data_ingest import LoanDataStream
+from modules.synthetic_data import make_loans
+
+
+@pytest.fixture(scope='module')
+def loan_csv(tmp_path_factory):
+    raw = make_loans(3000, 1)
+    # rows 1000 to 1499 are all filtered out by LoanDataLabelPredictor
+    raw.loc[1000:1499, 'application_type'] = 'JOINT'
+    path = tmp_path_factory.mktemp('data') / 'loans.csv'
+    raw.to_csv(path, index=False)
+    return path
+
+
+@pytest.fixture(scope='module')
+def in_memory(loan_csv):
+    return make_preprocess_pipeline().fit_transform(pd.read_csv(loan_csv))
+
+
+@pytest.mark.parametrize('chunksize', [500, 700, 3000, 10000])
+def test_stream_equals_in_memory(loan_csv, in_memory, chunksize):
+    chunks = list(LoanDataStream(make_preprocess_pipeline(), chunksize).fit_transform(loan_csv))
+    assert len(chunks) == -(-3000 // chunksize)
+    if chunksize == 500:
+        assert len(chunks[2][0]) == 0
+    predictor = pd.concat([chunk[0] for chunk in chunks], ignore_index=True)
+    label = np.concatenate([chunk[1] for chunk in chunks])
+    pd.testing.assert_frame_equal(predictor, in_memory[0], check_exact=True)
+    np.testing.assert_array_equal(label, in_memory[1])
@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules.drift import DriftMonitor
+
+
+@pytest.fixture(scope='module')
+def reference():
+    rng = np.random.default_rng(0)
+    n = 5000
+    X = pd.DataFrame({
+        'loan_amnt': rng.integers(1, 400, n) * 100.,
+        'int_rate': rng.normal(12, 4, n),
+        'issue_d': pd.to_datetime('2015-01-01')
+            + pd.to_timedelta(rng.integers(0, 1000, n), unit='D'),
+        'home_ownership': pd.Categorical(rng.choice(['RENT', 'OWN', 'MORTGAGE'], n)),
+        'grade': pd.Categorical(rng.choice(list('ABCDEFG'), n), ordered=True),
+        })
+    X.loc[rng.random(n) < 0.05, 'int_rate'] = np.nan
+    X.loc[rng.random(n) < 0.05, 'home_ownership'] = np.nan
+    return X
+
+
+def test_psi_is_zero_on_the_reference(reference):
+    report = DriftMonitor().fit(reference).update(reference).report()
+    assert set(report.index) == set(reference.columns)
+    np.testing.assert_allclose(report.psi, 0, atol=1e-12)
+    np.testing.assert_allclose(report.ks.dropna(), 0, atol=1e-12)
+    assert not report.drifted.any()
+
+
+def test_psi_is_zero_on_the_reference_records(reference):
+    records = [
+        {feature: (None if pd.isna(value) else value) for feature, value in record.items()}
+        for record in reference.drop(columns='issue_d').to_dict('records')
+        ]
+    monitor = DriftMonitor().fit(reference.drop(columns='issue_d'))
+    report = monitor.update_records(records).report()
+    np.testing.assert_allclose(report.psi, 0, atol=1e-12)
+
+
+def test_shifted_feature_drifts(reference):
+    shifted = reference.assign(int_rate=reference.int_rate + 8)
+    report = DriftMonitor().fit(reference).update(shifted).report()
+    assert report.index[0] == 'int_rate'
+    assert report.drifted.tolist() == [True] + [False] * (len(report) - 1)
+
+
+def test_save_load(tmp_path, reference):
+    monitor = DriftMonitor().fit(reference)
+    monitor.save(tmp_path / 'drift.json')
+    loaded = DriftMonitor.load(tmp_path / 'drift.json')
+    current = reference.iloc[:1000]
+    pd.testing.assert_frame_equal(
+        loaded.update(current).report(), monitor.update(current).report())
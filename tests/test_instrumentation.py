@@ -0,0 +1,23 @@
+import numpy as np
+import pytest
+
+from modules.benchmark import BenchmarkRun
+from modules.instrumentation import PipelineInstrumentation, _reset_peak_rss, stage
+
+MiB = 2**20
+
+
+@pytest.mark.skipif(not _reset_peak_rss(), reason='peak resident set size is Linux only')
+def test_nested_stage_keeps_outer_peak():
+    def allocate_then_stage():
+        np.ones(200 * MiB // 8).sum()
+        with PipelineInstrumentation() as instrumentation:
+            with stage('inner', 1):
+                np.ones(20 * MiB // 8).sum()
+        return instrumentation.report()
+
+    run = BenchmarkRun(memory='rss')
+    report = run.measure('outer', 1, allocate_then_stage)
+    # the stage resets the peak after the 200 MiB allocation of the outer block
+    assert run.results[0]['peak_bytes'] > 150 * MiB
+    assert 10 * MiB < report.peak_bytes.iloc[0] < 150 * MiB
@@ -0,0 +1,66 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from modules.loan_selection import get_loan_choice, get_loan_frontier
+
+
+def brute_force(value, weight, constraint):
+    best = 0.
+    for mask in itertools.product([False, True], repeat=len(value)):
+        mask = np.array(mask)
+        if weight[mask].sum() <= constraint:
+            best = max(best, value[mask].sum())
+    return best
+
+
+def random_loans(seed, n=12, integral=True):
+    rng = np.random.default_rng(seed)
+    weight = rng.integers(1, 40, n) * 25.
+    if not integral:
+        weight += rng.random(n)
+    value = rng.normal(0.5, 1., n) * weight / 100
+    return value, weight
+
+
+@pytest.mark.parametrize('method', ['auto', 'dp', 'bnb'])
+@pytest.mark.parametrize('seed', range(10))
+def test_loan_choice_is_optimal(seed, method):
+    value, weight = random_loans(seed)
+    constraint = weight.sum() / 3
+    selected = get_loan_choice(value, weight, constraint, method=method)
+    assert np.all(np.diff(selected) > 0)
+    assert weight[selected].sum() <= constraint
+    assert value[selected].sum() == pytest.approx(brute_force(value, weight, constraint))
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_loan_choice_is_optimal_for_fractional_weights(seed):
+    value, weight = random_loans(seed, integral=False)
+    constraint = weight.sum() / 2
+    selected = get_loan_choice(value, weight, constraint)
+    assert weight[selected].sum() <= constraint
+    assert value[selected].sum() == pytest.approx(brute_force(value, weight, constraint))
+
+
+@pytest.mark.parametrize('method', ['auto', 'dp', 'bnb'])
+@pytest.mark.parametrize('seed', range(5))
+def test_loan_frontier_is_optimal_for_every_budget(seed, method):
+    value, weight = random_loans(seed)
+    budgets = np.array([-25., 0., 100., 350., weight.sum() / 2, weight.sum()])
+    objective, selected = get_loan_frontier(value, weight, budgets, method=method)
+    assert selected.shape == (len(value), len(budgets))
+    for j, budget in enumerate(budgets):
+        assert weight[selected[:, j]].sum() <= max(budget, 0)
+        assert objective[j] == pytest.approx(value[selected[:, j]].sum())
+        assert objective[j] == pytest.approx(brute_force(value, weight, budget))
+
+
+def test_loan_frontier_matches_loan_choice():
+    value, weight = random_loans(0, n=30)
+    budgets = np.linspace(0, weight.sum(), 7)
+    _, selected = get_loan_frontier(value, weight, budgets, method='dp')
+    for j, budget in enumerate(budgets):
+        np.testing.assert_array_equal(
+            np.flatnonzero(selected[:, j]), get_loan_choice(value, weight, budget, method='dp'))
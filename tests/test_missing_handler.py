@@ -0,0 +1,298 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules.benchmark import make_preprocess_pipeline
+from modules.data_preprocess import LoanDataMissingHandler
+from modules.synthetic_data import make_loans
+
+
+class BaselineMissingHandler():
+    # the `_perform` cascade LoanDataMissingHandler replaced, verbatim
+    def __init__(self):
+        pass
+
+    def _perform(self, masking, feature=None, replace_value=None, drop_obs=False):
+        if replace_value:
+            self.X.loc[masking, feature] = replace_value
+        if drop_obs:
+            self.X = self.X.drop(self.X[masking].index)
+
+    def fit(self, X, y=None):
+        self.median_cond_3_ = X.loc[
+            (X.delinq_2yrs > 0) & (X.acc_now_delinq == 0),
+            'mths_since_last_delinq'].median()
+        return self
+
+    def transform(self, X, y=None):
+        self.X = X
+        # mths_since_last_record
+        rec_condition_1 = (self.X.mths_since_last_record.isna()) & (self.X.pub_rec == 0)
+        self._perform(rec_condition_1, 'mths_since_last_record', 300)
+        rec_condition_2 = (self.X.mths_since_last_record.isna()) & (self.X.pub_rec > 0)
+        self._perform(rec_condition_2, 'mths_since_last_record', 1)
+        rec_condition_3 = (self.X.mths_since_last_record.isna()) & (self.X.pub_rec.isna())
+        self._perform(rec_condition_3, drop_obs=True)
+        # mths_since_last_delinq
+        last_delinq_condition_1 = \
+            (self.X.mths_since_last_delinq.isna())\
+            & (self.X.delinq_2yrs == 0)\
+            & (self.X.acc_now_delinq == 0)
+        self._perform(last_delinq_condition_1, 'mths_since_last_delinq', 300)
+        last_delinq_condition_2 = \
+            (self.X.mths_since_last_delinq.isna())\
+            & (self.X.delinq_2yrs > 0)\
+            & (self.X.acc_now_delinq > 0)
+        self._perform(last_delinq_condition_2, 'mths_since_last_delinq', 1)
+        last_delinq_condition_3 = \
+            (self.X.mths_since_last_delinq.isna())\
+            & (self.X.delinq_2yrs > 0)\
+            & (self.X.acc_now_delinq == 0)
+        self._perform(last_delinq_condition_3, 'mths_since_last_delinq', self.median_cond_3_)
+        last_delinq_condition_4 = \
+            (self.X.mths_since_last_delinq == 0)\
+            & (self.X.delinq_2yrs > 0)\
+            & (self.X.acc_now_delinq == 0)
+        self._perform(last_delinq_condition_4, 'mths_since_last_delinq', self.median_cond_3_)
+        last_delinq_condition_5 = \
+            (self.X.mths_since_last_delinq.between(0, 25, inclusive='neither'))\
+            & (self.X.delinq_2yrs == 0)\
+            & (self.X.acc_now_delinq == 0)
+        self._perform(last_delinq_condition_5, 'delinq_2yrs', 1)
+        last_delinq_condition_6 = \
+            (self.X.mths_since_last_delinq == 0)\
+            & (self.X.delinq_2yrs == 0)\
+            & (self.X.acc_now_delinq == 0)
+        self._perform(last_delinq_condition_6, 'mths_since_last_delinq', 300)
+        last_delinq_condition_7 = \
+            (self.X.mths_since_last_delinq.isna())\
+            & (self.X.delinq_2yrs.isna())\
+            & (self.X.acc_now_delinq.isna())
+        self._perform(last_delinq_condition_7, drop_obs=True)
+        # inq_last_{6mths, 12mths}
+        inq_condition_1 = \
+            (self.X.inq_last_6mths.isna() | self.X.inq_last_12m.isna())\
+            & (self.X.inq_fi == 0)
+        self._perform(inq_condition_1, ['inq_last_6mths', 'inq_last_12m'], 0)
+        inq_condition_2 = \
+            (self.X.inq_last_6mths.isna() | self.X.inq_last_12m.isna())\
+            & (self.X.inq_fi > 0)
+        try:
+            self._perform(inq_condition_2, 'inq_last_6mths', self.X.loc[inq_condition_2, 'inq_fi'])
+            self._perform(inq_condition_2, 'inq_last_12m', self.X.loc[inq_condition_2, 'inq_fi'])
+        except ValueError:
+            pass
+        inq_condition_3 = \
+            (self.X.inq_last_6mths.isna() & self.X.inq_last_12m.isna())\
+            & (self.X.inq_fi.isna())
+        self._perform(inq_condition_3, drop_obs=True)
+        # open_acc
+        acc_condition_1_2 = \
+            (self.X.open_acc.isna() | self.X.total_acc.isna())\
+            & ((self.X.open_acc == 0) | (self.X.total_acc == 0))
+        self._perform(acc_condition_1_2, 'open_acc', 0)
+        self._perform(acc_condition_1_2, 'total_acc', 0)
+        acc_condition_3_4 = \
+            (self.X.open_acc.isna() | self.X.total_acc.isna())\
+            & ((self.X.open_acc > 0) | (self.X.total_acc > 0))
+        self._perform(acc_condition_3_4, drop_obs=True)
+        acc_condition_5 = \
+            self.X.open_acc.isna() & self.X.total_acc.isna()
+        self._perform(acc_condition_5, drop_obs=True)
+        # total_acc, tot_cur_bar
+        bal_condition_1_2 = \
+            (self.X.tot_cur_bal.isna() | self.X.total_acc.isna())\
+            & ((self.X.tot_cur_bal == 0) | (self.X.total_acc == 0))
+        self._perform(bal_condition_1_2, 'total_acc', 0)
+        self._perform(bal_condition_1_2, 'tot_cur_bal', 0)
+        bal_condition_3_4 = \
+            (self.X.tot_cur_bal.isna() | self.X.total_acc.isna())\
+            & ((self.X.tot_cur_bal > 0) | (self.X.total_acc > 0))
+        self._perform(bal_condition_3_4, drop_obs=True)
+        bal_condition_5 = \
+            self.X.tot_cur_bal.isna() & self.X.total_acc.isna()
+        self._perform(bal_condition_5, drop_obs=True)
+        # total_coll_amnt
+        coll_condition_1 = \
+            self.X.tot_coll_amt.isna() & self.X.collections_12_mths_ex_med.isna()
+        self._perform(coll_condition_1, drop_obs=True)
+        coll_condition_2_3 = \
+            (self.X.tot_coll_amt.isna() | (self.X.tot_coll_amt == 0))\
+            & (self.X.collections_12_mths_ex_med.isna() | (self.X.collections_12_mths_ex_med == 0))
+        self._perform(coll_condition_2_3, 'tot_coll_amt', 0)
+        self._perform(coll_condition_2_3, 'collections_12_mths_ex_med', 0)
+        coll_condition_4 = \
+            self.X.tot_coll_amt.isna() & (self.X.collections_12_mths_ex_med > 0)
+        self._perform(coll_condition_4, drop_obs=True)
+        coll_condition_5 = \
+            (self.X.tot_coll_amt == 0) & (self.X.collections_12_mths_ex_med.isna())
+        self._perform(coll_condition_5, drop_obs=True)
+        # open_il
+        open_il_condition_1 = \
+            (self.X.open_il_12m.isna() | self.X.open_il_24m.isna())\
+            & (self.X.mths_since_rcnt_il.isna())\
+            & (self.X.total_bal_il == 0)
+        self._perform(open_il_condition_1, 'mths_since_rcnt_il', 300)
+        self._perform(open_il_condition_1, 'open_il_12m', 0)
+        self._perform(open_il_condition_1, 'open_il_24m', 0)
+        open_il_condition_2 = \
+            (self.X.open_il_12m.isna() | self.X.open_il_24m.isna())\
+            & (self.X.mths_since_rcnt_il.isna())\
+            & (self.X.total_bal_il > 0)
+        self._perform(open_il_condition_2, drop_obs=True)
+        open_il_condition_3 = \
+            ((self.X.open_il_12m > 0) | (self.X.open_il_24m > 0))\
+            & (self.X.mths_since_rcnt_il.isna())\
+            & (self.X.total_bal_il > 0)
+        self._perform(open_il_condition_3, 'mths_since_rcnt_il', 1)
+        open_il_condition_4 = \
+            (self.X.open_il_12m.isna() & self.X.open_il_24m.isna())\
+            & (self.X.mths_since_rcnt_il.isna())\
+            & (self.X.total_bal_il.isna())
+        self._perform(open_il_condition_4, 'open_il_12m', 0)
+        self._perform(open_il_condition_4, 'open_il_24m', 0)
+        self._perform(open_il_condition_4, 'mths_since_rcnt_il', 300)
+        self._perform(open_il_condition_4, 'total_bal_il', 0)
+        # total_bal_il
+        bal_il_condition_1 = \
+            (self.X.total_bal_il > 0)\
+            & (self.X.il_util.isna())
+        self._perform(bal_il_condition_1, drop_obs=True)
+        bal_il_condition_2 = \
+            (self.X.total_bal_il.isna())\
+            & (self.X.il_util > 0)
+        self._perform(bal_il_condition_2, drop_obs=True)
+        bal_il_condition_3 = \
+            (self.X.total_bal_il.isna())\
+            & (self.X.il_util == 0)
+        self._perform(bal_il_condition_3, 'total_bal_il', 0)
+        bal_il_condition_4 = \
+            (self.X.total_bal_il == 0)\
+            & (self.X.il_util.isna())
+        self._perform(bal_il_condition_4, 'il_util', 0)
+        bal_il_condition_5 = \
+            (self.X.total_bal_il.isna())\
+            & (self.X.il_util.isna())
+        self._perform(bal_il_condition_5, 'total_bal_il', 0)
+        self._perform(bal_il_condition_5, 'il_util', 0)
+        # revol_bal
+        revol_condition_1 = \
+            (self.X.revol_bal > 0)\
+            & (self.X.revol_util.isna())
+        self._perform(revol_condition_1, drop_obs=True)
+        revol_condition_2 = \
+            (self.X.revol_bal.isna())\
+            & (self.X.revol_util > 0)
+        self._perform(revol_condition_2, drop_obs=True)
+        revol_condition_3 = \
+            (self.X.revol_bal.isna())\
+            & (self.X.revol_util == 0)
+        self._perform(revol_condition_3, 'revol_bal', 0)
+        revol_condition_4 = \
+            (self.X.revol_bal == 0)\
+            & (self.X.revol_util.isna())
+        self._perform(revol_condition_4, 'revol_util', 0)
+        revol_condition_5 = \
+            (self.X.revol_bal.isna())\
+            & (self.X.revol_util.isna())
+        self._perform(revol_condition_5, 'revol_bal', 0)
+        self._perform(revol_condition_5, 'revol_util', 0)
+        ## Mandatory Features
+        mandatory_features = [
+            'annual_inc', 'dti', 'home_ownership',
+            'loan_amnt', 'term', 'int_rate', 'installment',
+            'grade', 'sub_grade', 'pymnt_plan'
+            ]
+        for feature in mandatory_features:
+            try:
+                condition = self.X[feature].isna()
+                self._perform(condition, drop_obs=True)
+            except KeyError:
+                continue
+        ## replace missing values outside special conditions
+        # replace 0
+        replace_0 = [
+            'il_util', 'total_cu_tl', 'inq_last_12m', 'all_util', 'open_rv_24m', 'open_rv_12m', 'open_acc_6m',
+            'total_bal_il', 'inq_fi', 'open_il_12m', 'open_il_24m', 'tot_coll_amt', 'tot_cur_bal', 'total_rev_hi_lim',
+            'revol_util', 'collections_12_mths_ex_med', 'pub_rec', 'acc_now_delinq', 'total_acc', 'open_acc', 'inq_last_6mths',
+            'delinq_2yrs', 'max_bal_bc'
+            ]
+        for feature in replace_0:
+            try:
+                self.X.loc[:, feature] = self.X.loc[:, feature].fillna(0)
+            except KeyError:
+                continue
+        replace_300 = [
+            'mths_since_rcnt_il', 'mths_since_last_record', 'mths_since_last_major_derog', 'mths_since_last_delinq',
+            ]
+        for feature in replace_300:
+            try:
+                self.X.loc[:, feature] = self.X.loc[:, feature].fillna(300)
+            except KeyError:
+                continue
+        label = self.X.loan_category.values
+        predictor = self.X.drop(columns=['loan_category']).reset_index(drop=True)
+        return predictor, label
+
+
+def assert_same_as_baseline(X, X_fit=None):
+    X_fit = X if X_fit is None else X_fit
+    expected, expected_label = BaselineMissingHandler().fit(X_fit.copy()).transform(X.copy())
+    predictor, label = LoanDataMissingHandler().fit(X_fit.copy()).transform(X.copy())
+    pd.testing.assert_frame_equal(predictor, expected, check_exact=True)
+    np.testing.assert_array_equal(label, expected_label)
+    assert label.dtype == expected_label.dtype
+    return predictor
+
+
+@pytest.fixture(scope='module')
+def labelled():
+    # output of LoanDataLabelPredictor, the input of LoanDataMissingHandler
+    X = make_preprocess_pipeline()[:2].fit_transform(make_loans(5000, 0))
+    return X
+
+
+def test_same_as_baseline(labelled):
+    assert_same_as_baseline(labelled)
+
+
+def quirk_frame(labelled, **rows):
+    # one row of `labelled` per quirk, with the given values
+    X = labelled.iloc[:len(rows)].copy()
+    for i, values in enumerate(rows.values()):
+        for feature, value in values.items():
+            X.loc[X.index[i], feature] = value
+    return X
+
+
+def test_inq_condition_2_never_applies(labelled):
+    # the Series replace value of `_perform` has no truth value, the
+    # ValueError was swallowed: missing inquiries become 0, not inq_fi
+    X = quirk_frame(labelled, inq={'inq_last_6mths': np.nan, 'inq_last_12m': 2., 'inq_fi': 3.})
+    predictor = assert_same_as_baseline(X)
+    assert predictor.loc[0, ['inq_last_6mths', 'inq_last_12m']].tolist() == [0., 2.]
+
+
+def test_falsy_fills_are_skipped(labelled):
+    # coll_condition_2_3 fills 0, which was never written, so
+    # coll_condition_5 then drops the row instead of keeping it
+    X = quirk_frame(
+        labelled,
+        dropped={'tot_coll_amt': 0., 'collections_12_mths_ex_med': np.nan},
+        kept={'tot_coll_amt': 0., 'collections_12_mths_ex_med': 0.})
+    predictor = assert_same_as_baseline(X)
+    assert len(predictor) == 1
+    assert predictor.loc[0, 'collections_12_mths_ex_med'] == 0
+
+
+def test_integer_column_promoted_to_float(labelled):
+    # a fractional median written into an int64 column makes it float64,
+    # as the `.loc` write of the baseline did
+    X_fit = labelled.iloc[:100].assign(delinq_2yrs=1., acc_now_delinq=0.)
+    X_fit['mths_since_last_delinq'] = np.where(np.arange(100) % 2, 10., 11.)
+    X = quirk_frame(labelled, delinq={
+        'mths_since_last_delinq': 0., 'delinq_2yrs': 2., 'acc_now_delinq': 0.})
+    X['mths_since_last_delinq'] = X.mths_since_last_delinq.fillna(5).astype('int64')
+    predictor = assert_same_as_baseline(X, X_fit)
+    assert predictor.mths_since_last_delinq.dtype == 'float64'
+    assert predictor.loc[0, 'mths_since_last_delinq'] == 10.5
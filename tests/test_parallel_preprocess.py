@@ -0,0 +1,41 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules.benchmark import make_preprocess_pipeline
+from modules.parallel_preprocess import PartitionedTransform
+from modules.synthetic_data import make_loans
+
+
+@pytest.fixture
+def two_cores(monkeypatch):
+    monkeypatch.setattr(os, 'cpu_count', lambda: 2)
+
+
+@pytest.mark.parametrize('compact', [False, True])
+@pytest.mark.parametrize('n_partitions', [3, 16])
+def test_partitioned_transform_equals_serial(two_cores, compact, n_partitions):
+    # seed 2 has partitions of int32 and float32 annual_inc, float32 serially
+    raw = make_loans(30000, 2)
+    pipeline = make_preprocess_pipeline()
+    pipeline.steps[0][1].compact = compact
+    pipeline.fit(raw.copy())
+    expected, expected_label = pipeline.transform(raw.copy())
+    before = raw.copy()
+    predictor, label = PartitionedTransform(
+        pipeline, n_jobs=2, n_partitions=n_partitions, min_partition_rows=1000).transform(raw)
+    pd.testing.assert_frame_equal(predictor, expected, check_exact=True)
+    np.testing.assert_array_equal(label, expected_label)
+    pd.testing.assert_frame_equal(raw, before)
+
+
+def test_small_input_runs_serially(two_cores, monkeypatch):
+    raw = make_loans(2000, 0)
+    pipeline = make_preprocess_pipeline().fit(raw.copy())
+    transform = PartitionedTransform(pipeline, n_jobs=2)
+    assert transform._partitions(len(raw), 2) == [(0, len(raw))]
+    monkeypatch.setattr('modules.parallel_preprocess.ProcessPoolExecutor', None)
+    predictor, _ = transform.transform(raw)
+    pd.testing.assert_frame_equal(predictor, pipeline.transform(raw.copy())[0])
@@ -0,0 +1,82 @@
+import copy
+
+import numpy as np
+import pytest
+from xgboost import XGBClassifier
+
+from modules.benchmark import make_feature_pipeline, make_preprocess_pipeline
+from modules.scoring import LoanScorer
+from modules.scoring_runtime import load_scorer
+from modules.synthetic_data import make_loans
+
+
+@pytest.fixture(scope='module')
+def fitted():
+    preprocess_pipeline = make_preprocess_pipeline()
+    feature_pipeline = make_feature_pipeline()
+    X, y = preprocess_pipeline.fit_transform(make_loans(6000, 0))
+    classifier = XGBClassifier(n_estimators=5, max_depth=3).fit(
+        feature_pipeline.fit_transform(X, y), y == 'Bad Loan')
+    return preprocess_pipeline, feature_pipeline, classifier
+
+
+@pytest.fixture(scope='module')
+def raw_test(fitted):
+    raw = make_loans(1000, 1)
+    # the scorer scores applications, the label filters are left to the batch path
+    return raw[fitted[0].named_steps['extract_label_predictor'].keep_rows(raw)]
+
+
+def test_scorer_rows_equal_batch_transform(fitted, raw_test):
+    preprocess_pipeline, feature_pipeline, classifier = fitted
+    X, _ = preprocess_pipeline.transform(raw_test.copy())
+    expected = feature_pipeline.transform(X).to_numpy(dtype='float64')
+    matrix, errors = LoanScorer(*fitted).transform_many(raw_test.to_dict('records'))
+    kept = [error is None for error in errors]
+    # the scorer rejects the applications the missing handler drops
+    assert 0 < len(X) == sum(kept) < len(raw_test)
+    np.testing.assert_allclose(matrix[kept], expected, rtol=1e-6)
+
+
+def test_scorer_predict_proba_equals_classifier(fitted, raw_test):
+    preprocess_pipeline, feature_pipeline, classifier = fitted
+    X, _ = preprocess_pipeline.transform(raw_test.iloc[:50].copy())
+    expected = classifier.predict_proba(feature_pipeline.transform(X))[:, 1]
+    scorer = LoanScorer(*fitted)
+    probas = []
+    for record in raw_test.iloc[:50].to_dict('records'):
+        try:
+            probas.append(scorer.predict_proba(record))
+        except ValueError:
+            continue
+    np.testing.assert_allclose(probas, expected, rtol=1e-5)
+
+
+def with_handle_unknown(feature_pipeline, handle_unknown):
+    feature_pipeline = copy.deepcopy(feature_pipeline)
+    column_transformer = feature_pipeline.steps[-1][1]
+    column_transformer.named_transformers_['categorical'].handle_unknown = handle_unknown
+    return feature_pipeline
+
+
+@pytest.mark.parametrize('handle_unknown', ['ignore', 'error'])
+def test_unknown_category(tmp_path, fitted, raw_test, handle_unknown):
+    preprocess_pipeline, feature_pipeline, classifier = fitted
+    scorer = LoanScorer(
+        preprocess_pipeline, with_handle_unknown(feature_pipeline, handle_unknown), classifier)
+    records = raw_test.to_dict('records')
+    _, errors = scorer.transform_many(records)
+    valid = records[[error is None for error in errors].index(True)]
+    unknown = {**valid, 'home_ownership': 'MARS'}
+    scorer.save(tmp_path)
+    for scorer_ in [scorer, load_scorer(tmp_path)]:
+        _, errors = scorer_.transform_many([valid, unknown, valid])
+        if handle_unknown == 'ignore':
+            assert errors == [None, None, None]
+        else:
+            # only the record with the unknown category fails
+            assert (errors[0], errors[2]) == (None, None)
+            assert isinstance(errors[1], ValueError)
+            assert 'unknown category' in str(errors[1])
+            with pytest.raises(ValueError, match='unknown category'):
+                scorer_.predict_proba(unknown)
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+import xgboost as xgb
+
+from modules.scoring_runtime import TreeEnsemble
+
+
+@pytest.fixture(scope='module')
+def data():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(2000, 8)).astype('float32')
+    y = (X[:, 0] + X[:, 1] * X[:, 2] + rng.normal(scale=0.5, size=len(X)) > 0).astype(int)
+    # missing values exercise the default directions
+    X[rng.random(X.shape) < 0.1] = np.nan
+    return X, y
+
+
+@pytest.fixture(scope='module')
+def booster(data):
+    X, y = data
+    return xgb.train(
+        {'objective': 'binary:logistic', 'max_depth': 4, 'eta': 0.3, 'base_score': 0.3},
+        xgb.DMatrix(X, label=y), num_boost_round=30)
+
+
+def test_tree_ensemble_matches_inplace_predict(data, booster):
+    X, _ = data
+    np.testing.assert_allclose(
+        TreeEnsemble.from_booster(booster).predict(X), booster.inplace_predict(X),
+        rtol=1e-5, atol=1e-6)
+
+
+def test_tree_ensemble_iteration_range(data, booster):
+    X, _ = data
+    np.testing.assert_allclose(
+        TreeEnsemble.from_booster(booster, iteration_range=(0, 10)).predict(X),
+        booster.inplace_predict(X, iteration_range=(0, 10)),
+        rtol=1e-5, atol=1e-6)
+
+
+def test_tree_ensemble_save_load(tmp_path, data, booster):
+    X, _ = data
+    ensemble = TreeEnsemble.from_booster(booster)
+    loaded = TreeEnsemble.load(tmp_path, **ensemble.save(tmp_path))
+    np.testing.assert_array_equal(loaded.predict(X), ensemble.predict(X))